@@ -0,0 +1,53 @@
+"""Per-node overhead of the context system
+
+Run with asv, or directly with `python -m benchmarks.context` for a quick report.
+"""
+import timeit
+
+from squigglypy.cache import SampleCache
+from squigglypy.context import Context
+from squigglypy.dsl import normal
+
+
+class ContextOverhead:
+    params = [1, 1000]
+    param_names = ["sample_count"]
+
+    def setup(self, sample_count: int):
+        self.context = Context(cache=SampleCache(), sample_count=sample_count, seed=0)
+        self.context.__enter__()
+        self.leaves = [normal(i, 1) for i in range(1000)]
+        for leaf in self.leaves:
+            ~leaf  # Warm the cache, so that only the bookkeeping is measured
+
+    def teardown(self, _: int):
+        self.context.__exit__(None, None, None)
+
+    def time_getcontext(self, _: int):
+        for _ in range(1000):
+            Context.getcontext()
+
+    def time_child_context(self, _: int):
+        for _ in range(1000):
+            with Context(sample_count=10):
+                pass
+
+    def time_cached_leaves(self, _: int):
+        for leaf in self.leaves:
+            ~leaf
+
+    def time_cache_keys(self, _: int):
+        for leaf in self.leaves:
+            leaf.cache_key
+
+
+if __name__ == "__main__":
+    benchmark = ContextOverhead()
+    for sample_count in ContextOverhead.params:
+        benchmark.setup(sample_count)
+        for name in ["time_getcontext", "time_child_context", "time_cached_leaves"]:
+            seconds = min(
+                timeit.repeat(lambda: getattr(benchmark, name)(sample_count), number=10, repeat=5)
+            )
+            print(f"{name}[{sample_count}]: {seconds / 10 / 1000 * 1e9:.0f} ns per node")
+        benchmark.teardown(sample_count)
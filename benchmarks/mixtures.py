@@ -0,0 +1,51 @@
+"""Sampling mixtures with many components"""
+from concurrent.futures import ThreadPoolExecutor
+
+from squigglypy.context import Context
+from squigglypy.dsl import mixture, sum_of
+from squigglypy.scheduler import resolve_threaded
+
+from .models import leaves
+
+
+class Mixtures:
+    params = ([2, 100, 10000], [False, True])
+    param_names = ["components", "weighted"]
+
+    def setup(self, components: int, weighted: bool):
+        self.context = Context(cache={}, cache_rule="never", sample_count=10 ** 5, seed=0)
+        self.context.__enter__()
+        weights = list(range(1, components + 1)) if weighted else None
+        self.tree = mixture(leaves(components), weights=weights)
+
+    def teardown(self, *_):
+        self.context.__exit__(None, None, None)
+
+    def time_resolve(self, *_):
+        ~self.tree
+
+    def peakmem_resolve(self, *_):
+        ~self.tree
+
+
+class ThreadedMixtures:
+    """Mixtures of independent submodels, resolved in sequence and on a thread pool"""
+
+    params = ([4, 32], [1, 4, 8])
+    param_names = ["components", "workers"]
+
+    def setup(self, components: int, workers: int):
+        self.context = Context(cache={}, cache_rule="never", sample_count=10 ** 6, seed=0)
+        self.context.__enter__()
+        self.tree = mixture([sum_of(leaves(16)) * leaf for leaf in leaves(components)])
+        self.executor = ThreadPoolExecutor(workers)
+
+    def teardown(self, *_):
+        self.executor.shutdown()
+        self.context.__exit__(None, None, None)
+
+    def time_resolve(self, *_):
+        ~self.tree
+
+    def time_resolve_threaded(self, *_):
+        resolve_threaded(self.tree, executor=self.executor)
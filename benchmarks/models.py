@@ -0,0 +1,50 @@
+"""Generated models of configurable shape for the benchmarks"""
+from typing import Callable, List
+
+from squigglypy.dsl import lognormal, mixture, normal, uniform
+from squigglypy.tree import BaseValue
+
+
+def leaves(count: int) -> List[BaseValue]:
+    """Return distinct distributions, so that no two leaves share a cache entry"""
+    constructors = [
+        lambda i: normal(i, 1),
+        lambda i: lognormal(0, 1 / (i + 1)),
+        lambda i: uniform(i, i + 1),
+    ]
+    return [constructors[i % 3](i) for i in range(count)]
+
+
+def deep(depth: int) -> BaseValue:
+    """Return a chain in which every operation depends on the previous one"""
+    tree = normal(0, 1)
+    for leaf in leaves(depth):
+        tree = tree / 2 + leaf
+    return tree
+
+
+def balanced(values: List[BaseValue]) -> BaseValue:
+    """Return a sum over the values that is only logarithmically deep"""
+    level = values
+    while len(level) > 1:
+        pairs = zip(level[::2], level[1::2])
+        level = [this + other for this, other in pairs] + level[len(level) // 2 * 2 :]
+    return level[0]
+
+
+def wide(width: int) -> BaseValue:
+    return balanced(leaves(width))
+
+
+def mixed(components: int) -> BaseValue:
+    return mixture(leaves(components))
+
+
+def model(size: int) -> Callable[[BaseValue], BaseValue]:
+    """Return a model of a variable that has `size` leaves, half of which depend on it"""
+
+    def model_(x: BaseValue) -> BaseValue:
+        parts = leaves(size)
+        return balanced([part * x if i % 2 else part for i, part in enumerate(parts)])
+
+    return model_
@@ -0,0 +1,31 @@
+"""Integrals whose integrands depend on distributions"""
+import numpy as np
+
+from squigglypy.context import Context
+from squigglypy.dsl import integral, normal, uniform
+
+
+class Integrals:
+    params = ([10, 100, 1000], [False, True])
+    param_names = ["sample_count", "batched"]
+    timeout = 300
+
+    def setup(self, sample_count: int, batched: bool):
+        if not batched and sample_count > 100:
+            raise NotImplementedError("Too slow to be useful")
+        self.context = Context(cache={}, sample_count=sample_count, seed=0)
+        self.context.__enter__()
+        scale, shift = uniform(1, 2), normal(0, 1)
+        self.finite = integral(lambda x: scale * x ** 2 + shift, 0, 3, batched=batched)
+        self.infinite = integral(
+            lambda x: scale * np.exp(-(x ** 2)), -np.inf, np.inf, batched=batched
+        )
+
+    def teardown(self, *_):
+        self.context.__exit__(None, None, None)
+
+    def time_finite(self, *_):
+        ~self.finite
+
+    def time_infinite(self, *_):
+        ~self.infinite
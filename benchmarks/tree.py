@@ -0,0 +1,81 @@
+"""Resolution of operation chains across tree shapes and sample counts"""
+from squigglypy.context import Context
+from squigglypy.tree import compile
+
+from .models import deep, wide
+
+
+class _Resolution:
+    """Resolve without caching, so that every repeat does the full work"""
+
+    sample_count = 1000
+
+    def enter(self, sample_count: int, dtype: str = "float64"):
+        self.context = Context(
+            cache={}, cache_rule="never", sample_count=sample_count, dtype=dtype, seed=0
+        )
+        self.context.__enter__()
+
+    def teardown(self, *_):
+        self.context.__exit__(None, None, None)
+
+
+class DeepChains(_Resolution):
+    params = [10, 1000, 33_000]  # The last has about 10^5 nodes
+    param_names = ["depth"]
+    timeout = 300
+
+    def setup(self, depth: int):
+        self.enter(self.sample_count)
+        self.tree = deep(depth)
+
+    def time_resolve(self, _: int):
+        ~self.tree
+
+    def time_compile(self, _: int):
+        compile(self.tree)
+
+    def time_resolve_compiled(self, _: int):
+        ~compile(self.tree)
+
+
+class WideSums(_Resolution):
+    params = [10, 1000, 10 ** 5]
+    param_names = ["width"]
+    timeout = 300
+
+    def setup(self, width: int):
+        self.enter(self.sample_count)
+        self.tree = wide(width)
+
+    def time_resolve(self, _: int):
+        ~self.tree
+
+    def time_resolve_compiled(self, _: int):
+        ~compile(self.tree)
+
+    def time_compile(self, _: int):
+        compile(self.tree)
+
+
+class SampleCounts(_Resolution):
+    params = ([10 ** 3, 10 ** 5, 10 ** 7, 10 ** 8], ["float64", "float32"])
+    param_names = ["sample_count", "dtype"]
+    timeout = 600
+
+    def setup(self, sample_count: int, dtype: str):
+        self.enter(sample_count, dtype)
+        self.tree = deep(4)
+        self.plan = compile(self.tree)
+
+    def time_resolve(self, *_):
+        ~self.tree
+
+    def time_resolve_compiled(self, *_):
+        ~self.plan
+
+    def peakmem_resolve(self, *_):
+        ~self.tree
+
+    def peakmem_resolve_compiled(self, *_):
+        ~self.plan
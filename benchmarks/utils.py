@@ -0,0 +1,45 @@
+"""Tracing and traversing large generated models"""
+import numpy as np
+
+from squigglypy.context import Context
+from squigglypy.utils import bfs, evaluate_grid, mark_constancy
+
+from .models import model
+
+
+class Traversal:
+    params = [100, 10000, 10 ** 5]
+    param_names = ["size"]
+    timeout = 300
+
+    def setup(self, size: int):
+        self.model = model(size)
+
+    def time_mark_constancy(self, _: int):
+        mark_constancy(self.model)
+
+    def time_bfs(self, _: int):
+        bfs(self.model)
+
+    def peakmem_bfs(self, _: int):
+        bfs(self.model)
+
+
+class Grids:
+    params = ([10, 100, 1000], [10, 100])
+    param_names = ["points", "size"]
+
+    def setup(self, points: int, size: int):
+        self.context = Context(cache={}, sample_count=1000, seed=0)
+        self.context.__enter__()
+        self.xs = np.linspace(0, 1, points)
+        self.model = model(size)
+
+    def teardown(self, *_):
+        self.context.__exit__(None, None, None)
+
+    def time_evaluate_grid(self, *_):
+        evaluate_grid(self.model, self.xs)
+
+    def peakmem_evaluate_grid(self, *_):
+        evaluate_grid(self.model, self.xs)
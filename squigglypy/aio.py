@@ -0,0 +1,36 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import Executor
+from typing import Any, Optional
+
+from .context import Context
+from .tree import Resolveable
+
+
+def _resolve(value: Resolveable, cancelled: threading.Event) -> Any:
+    with Context(cancelled=cancelled):
+        return ~value
+
+
+async def resolve_async(
+    value: Resolveable, executor: Optional[Executor] = None, timeout: Optional[float] = None
+) -> Any:
+    """Resolve a value on an executor without blocking the event loop
+
+    The resolution runs in a copy of the current context, so settings such as the cache and the
+    seed carry over into the worker, and defaults to the default executor of the loop. Executors
+    must be thread-based, since contexts don't cross processes; use `resolve_parallel` for those.
+
+    If the coroutine is cancelled or times out, the resolution stops at the next node that it
+    resolves, so that it frees up the worker. Nodes that are being computed run to completion.
+    """
+    loop = asyncio.get_running_loop()
+    cancelled = threading.Event()
+    context = contextvars.copy_context()
+    future = loop.run_in_executor(executor, context.run, _resolve, value, cancelled)
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        cancelled.set()
+        raise
@@ -0,0 +1,142 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from .aio import _resolve
+from .tree import Resolveable
+
+
+def _read_only(result: Any) -> Any:
+    if isinstance(result, np.ndarray):
+        result = result.view()
+        result.flags.writeable = False
+    return result
+
+
+class _Flight:
+    """A resolution in progress and the callers waiting for it"""
+
+    __slots__ = ("future", "waiters", "cancelled")
+
+    def __init__(self):
+        self.future: "Future[Any]" = Future()
+        self.waiters = 0
+        self.cancelled = threading.Event()
+
+
+class Broker:
+    """Share the resolutions of structurally equal values between concurrent callers
+
+    Callers that resolve values with the same `cache_key`, i.e., the same structure, sample
+    count, and so on, while a resolution is in flight wait for that resolution instead of
+    starting their own, and all of them get the same read-only result. Results are kept for `ttl`
+    seconds, so that callers shortly after share it, too. Brokers can be used from threads and
+    from asyncio code at the same time.
+    """
+
+    def __init__(self, ttl: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.flights: Dict[Hashable, _Flight] = {}
+        self.results: Dict[Hashable, Tuple[float, Any]] = {}  # By key, with their expiry
+
+    def __len__(self):
+        return len(self.results)
+
+    def _join(self, key: Hashable) -> Tuple[Optional[_Flight], bool, Any]:
+        """Return the flight of a key and whether the caller started it, or the result"""
+        with self.lock:
+            now = self.clock()
+            for expired in [key_ for key_, (expiry, _) in self.results.items() if expiry <= now]:
+                del self.results[expired]
+            if key in self.results:
+                return None, False, self.results[key][1]
+            flight = self.flights.get(key)
+            started = flight is None or flight.cancelled.is_set()
+            if started:
+                flight = self.flights[key] = _Flight()
+            assert flight
+            flight.waiters += 1
+            return flight, started, None
+
+    def _land(self, key: Hashable, flight: _Flight, resolve: Callable[[], Any]):
+        try:
+            result = _read_only(resolve())
+        except BaseException as error:  # pylint: disable=broad-except
+            with self.lock:
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+            flight.future.set_exception(error)
+            return
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+            self.results[key] = (self.clock() + self.ttl, result)
+        flight.future.set_result(result)
+
+    def _leave(self, flight: _Flight, abandoned: bool):
+        with self.lock:
+            flight.waiters -= 1
+            if abandoned and not flight.waiters:  # Nobody wants the result anymore
+                flight.cancelled.set()
+
+    def resolve(self, value: Resolveable, timeout: Optional[float] = None) -> Any:
+        """Resolve a value in this thread, or wait at most `timeout` for the resolution in flight"""
+        key = value.cache_key
+        flight, started, result = self._join(key)
+        if flight is None:
+            return result
+        if started:
+            cancelled = flight.cancelled
+            self._land(key, flight, lambda: _resolve(value, cancelled))
+        abandoned = True
+        try:
+            result = flight.future.result(timeout)
+            abandoned = False
+        finally:
+            self._leave(flight, abandoned)
+        return result
+
+    async def resolve_async(
+        self,
+        value: Resolveable,
+        executor: Optional[Executor] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """Resolve a value on an executor, or wait for the resolution in flight
+
+        The resolution runs in a copy of the context of the caller that started it. It doesn't
+        depend on that caller, so that it continues when that caller is cancelled or times out,
+        but stops once all its callers are gone.
+        """
+        key = value.cache_key
+        flight, started, result = self._join(key)
+        if flight is None:
+            return result
+        if started:
+            context = contextvars.copy_context()
+            cancelled = flight.cancelled
+            asyncio.get_running_loop().run_in_executor(
+                executor,
+                self._land,
+                key,
+                flight,
+                lambda: context.run(_resolve, value, cancelled),
+            )
+        future = asyncio.wrap_future(flight.future)
+        # Retrieve the outcome even if this caller is gone, lest asyncio warn about it
+        future.add_done_callback(lambda future: future.cancelled() or future.exception())
+        abandoned = True
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout)
+            abandoned = False
+        finally:
+            self._leave(flight, abandoned)
+        return result
+
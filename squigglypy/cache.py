@@ -0,0 +1,202 @@
+import os
+import sys
+from collections import OrderedDict
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import RLock
+from typing import Any, Hashable, Iterator, MutableMapping, Optional, Tuple, Union
+
+import numpy as np
+
+DEFAULT_CACHE_BYTES = 2 ** 30
+DEFAULT_DISK_CACHE_BYTES = 2 ** 34
+
+
+def nbytes(value: Any) -> int:
+    size = getattr(value, "nbytes", None)
+    if size is None:
+        return sys.getsizeof(value)
+    return size
+
+
+class DiskCache(MutableMapping[Hashable, Any]):
+    """Persistent cache of sample arrays as `.npy` files
+
+    Files are named after the stable digest of their cache key, so any process can find them, and
+    they are loaded as read-only memory maps, so processes share their pages. Keys without stable
+    digests and values other than arrays aren't stored. The least recently used files are deleted
+    when the directory outgrows `max_bytes`.
+    """
+
+    def __init__(
+        self, directory: Union[str, Path], max_bytes: Optional[int] = DEFAULT_DISK_CACHE_BYTES
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.nbytes = sum(stat.st_size for _, stat in self._stats())
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        return f"{type(self).__name__}({str(self.directory)!r}, max_bytes={self.max_bytes})"
+
+    def _path(self, key: Hashable) -> Optional[Path]:
+        stable_digest = getattr(key, "stable_digest", None)
+        digest = stable_digest() if stable_digest else None
+        if digest is None:
+            return None
+        return self.directory / f"{digest}.npy"
+
+    def __getitem__(self, key: Hashable) -> Any:
+        path = self._path(key)
+        try:
+            if path is None:
+                raise KeyError(key)
+            value = np.load(path, mmap_mode="r").view(np.ndarray)
+            os.utime(path)  # Mark as recently used
+        except (FileNotFoundError, KeyError):
+            self.misses += 1
+            raise KeyError(key) from None
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any):
+        path = self._path(key)
+        if path is None or not isinstance(value, np.ndarray) or value.dtype.hasobject:
+            return
+        if self.max_bytes is not None and value.nbytes > self.max_bytes:
+            return
+        # Write to a temporary file first, so that other processes never see partial files
+        with NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as file:
+            np.save(file, value)
+        size = Path(file.name).stat().st_size
+        try:
+            self.nbytes -= path.stat().st_size
+        except FileNotFoundError:
+            pass
+        os.replace(file.name, path)
+        self.nbytes += size
+        if self.max_bytes is not None and self.nbytes > self.max_bytes:
+            self._evict()
+
+    def _stats(self) -> Iterator[Tuple[Path, os.stat_result]]:
+        # Other processes may delete files between listing and statting them
+        for path in self.directory.glob("*.npy"):
+            try:
+                yield path, path.stat()
+            except FileNotFoundError:
+                continue
+
+    def _evict(self):
+        stats = sorted(self._stats(), key=lambda item: item[1].st_mtime)
+        self.nbytes = sum(stat.st_size for _, stat in stats)
+        for path, stat in stats:
+            if self.max_bytes is None or self.nbytes <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self.nbytes -= stat.st_size
+            self.evictions += 1
+
+    def __delitem__(self, key: Hashable):
+        path = self._path(key)
+        try:
+            if path is None:
+                raise KeyError(key)
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            raise KeyError(key) from None
+        self.nbytes -= size
+
+    def __contains__(self, key: object) -> bool:
+        path = self._path(key)  # type: ignore
+        return path is not None and path.exists()
+
+    def __iter__(self) -> Iterator[Hashable]:
+        """Iterate over the stable digests of the stored keys, as the keys themselves aren't kept
+
+        The digests can't be used to look up values, so neither can `keys`, `items`, or `values`.
+        """
+        return (path.stem for path in self.directory.glob("*.npy"))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.directory.glob("*.npy"))
+
+
+class SampleCache(MutableMapping[Hashable, Any]):
+    """Sample cache with a byte budget and least-recently-used eviction
+
+    Lookups through `get` or `[]` count as hits or misses, membership tests don't. Misses fall
+    through to the `backing` cache if there is one, and new entries are written through to it.
+    """
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = DEFAULT_CACHE_BYTES,
+        backing: Optional[MutableMapping[Hashable, Any]] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.backing = backing
+        self.entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = RLock()
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}(entries={len(self)}, nbytes={self.nbytes}, "
+            f"max_bytes={self.max_bytes}, hits={self.hits}, misses={self.misses}, "
+            f"evictions={self.evictions})"
+        )
+
+    def __getitem__(self, key: Hashable) -> Any:
+        with self.lock:
+            try:
+                value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                if self.backing is None:
+                    raise
+                value = self.backing[key]
+                self._store(key, value)
+                return value
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key: Hashable, value: Any):
+        with self.lock:
+            self._store(key, value)
+            if self.backing is not None:
+                self.backing[key] = value
+
+    def _store(self, key: Hashable, value: Any):
+        size = nbytes(value)
+        with self.lock:
+            if key in self.entries:
+                del self[key]
+            if self.max_bytes is not None and size > self.max_bytes:
+                return  # Would evict everything else and still not fit
+            self.entries[key] = value
+            self.nbytes += size
+            while self.max_bytes is not None and self.nbytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.nbytes -= nbytes(evicted)
+                self.evictions += 1
+
+    def __delitem__(self, key: Hashable):
+        with self.lock:
+            self.nbytes -= nbytes(self.entries.pop(key))
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.entries
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(list(self.entries))
+
+    def __len__(self) -> int:
+        return len(self.entries)
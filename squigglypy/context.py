@@ -1,58 +1,328 @@
 import contextvars
-from dataclasses import dataclass, field
-from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+import sys
+import threading
+from enum import Enum
+from hashlib import sha256
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    MutableMapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+from weakref import WeakValueDictionary
+
+import numpy as np
+
+from .cache import SampleCache
+from .sampling import SAMPLINGS, Design
+
+if TYPE_CHECKING:
+    from .profiling import Profiler
 
 DEFAULT_SAMPLE_COUNT = 1000
 
 
-@dataclass(frozen=True)
-class CacheKey:
-    function: Optional[Callable[..., Any]] = None
-    args: Optional[Tuple[Any, ...]] = None
-    kwargs: Optional[Tuple[str, Any]] = None
+class NodeKey:
+    """Structural identity of a tree node
+
+    Keys are interned (hash-consed), so structurally equal nodes share the same key object, and
+    hashing or comparing a key is O(1) regardless of the size of the subtree beneath it. Volatile
+    keys belong to nodes that depend on mutable values, such as tracers, and must not be cached
+    across resolutions.
+    """
+
+    __slots__ = ("parts", "volatile", "interned", "stable", "__weakref__")
+
+    interned_keys: "WeakValueDictionary[Tuple[Any, ...], NodeKey]" = WeakValueDictionary()
+
+    def __init__(self, parts: Tuple[Any, ...], volatile: bool = False, interned: bool = False):
+        self.parts = parts
+        self.volatile = volatile
+        self.interned = interned
+        self.stable: Optional[str] = None  # Empty once it turns out that there is none
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(map(repr, self.parts))})"
+
+    def __reduce__(self):
+        if self.interned:
+            return (_intern, (self.parts, self.volatile))
+        return (type(self), (self.parts, self.volatile))
+
+    @classmethod
+    def intern(cls, *parts: Any, volatile: bool = False) -> "NodeKey":
+        # Nested keys too, such as those of the value parameters of distributions
+        volatile = volatile or any(part.volatile for part in _keys(parts))
+        try:
+            key = cls.interned_keys.get(parts)
+        except TypeError:  # Unhashable parts, such as arrays, are only equal to themselves
+            return cls(parts, volatile)
+        if key is None:
+            key = cls(parts, volatile, interned=True)
+            cls.interned_keys[parts] = key
+        return key
+
+    @classmethod
+    def unique(cls, *parts: Any, volatile: bool = False) -> "NodeKey":
+        return cls(parts, volatile)
+
+    def stable_digest(self) -> Optional[str]:
+        """Return a digest that is the same across processes, or `None` if there is none
+
+        Only interned keys whose parts are plain values, importable functions, and other such
+        keys have stable digests. Keys that are identified by object identity don't.
+        """
+        # Digest the keys beneath first, iteratively, so that deep trees don't exhaust the stack
+        stack = [self] if self.stable is None else []
+        while stack:
+            key = stack[-1]
+            pending = [part for part in _keys(key.parts) if part.stable is None]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            if key.stable is None:
+                encoded = _encode(key.parts) if key.interned else None
+                key.stable = "" if encoded is None else sha256(encoded.encode()).hexdigest()
+        return self.stable or None  # Empty if there is none
+
+
+def _intern(parts: Tuple[Any, ...], volatile: bool) -> NodeKey:
+    return NodeKey.intern(*parts, volatile=volatile)
+
+
+def _keys(parts: Tuple[Any, ...]) -> Iterator[NodeKey]:
+    for part in parts:
+        if isinstance(part, NodeKey):
+            yield part
+        elif isinstance(part, tuple):
+            yield from _keys(part)
+
+
+def _encode(part: Any) -> Optional[str]:
+    if isinstance(part, NodeKey):
+        return part.stable or None  # Digested before
+    if isinstance(part, tuple):
+        encoded = [_encode(item) for item in part]
+        if None in encoded:
+            return None
+        return f"({','.join(encoded)})"  # type: ignore
+    if part is None or isinstance(part, (bool, int, float, complex, str, bytes, np.generic)):
+        return f"{type(part).__name__}:{part!r}"
+    if isinstance(part, Enum):
+        return f"{type(part).__qualname__}.{part.name}"
+    qualname = getattr(part, "__qualname__", None)
+    module = getattr(part, "__module__", None)
+    if qualname is None or module is None or "<" in qualname:  # Lambdas and local functions
+        return None
+    # Only what the name finds again, not, e.g., the bound methods of different instances
+    found: Any = sys.modules.get(module)
+    for name in qualname.split("."):
+        found = getattr(found, name, None)
+    if found is not part:
+        return None
+    return f"{module}.{qualname}"
+
+
+class CacheKey(NamedTuple):
+    digest: Hashable
     sample_count: Optional[int] = None
-    nested: Optional[Tuple[Hashable, ...]] = None
+    dtype: Optional[np.dtype] = None
+    sampling: Optional[str] = None
+
+    def stable_digest(self) -> Optional[str]:
+        if not isinstance(self.digest, NodeKey):
+            return None
+        digest = self.digest.stable_digest()
+        if digest is None:
+            return None
+        dtype = None if self.dtype is None else self.dtype.str
+        return sha256(
+            f"{digest}:{self.sample_count}:{dtype}:{self.sampling}".encode()
+        ).hexdigest()
+
+
+def split_sample_count(sample_count: int, parts: int) -> List[int]:
+    """Split a sample count into parts whose sizes differ by at most one"""
+    remainder = sample_count % parts
+    return [sample_count // parts + int(i < remainder) for i in range(parts)]
+
+
+class Memo:
+    """Results of the nodes that a resolution reaches more than once
+
+    A node is the same random variable wherever it's reached, so unlike the cache, which may
+    evict results or not keep them at all, the memo keeps all of them for as long as the
+    outermost resolution runs.
+    """
+
+    __slots__ = ("shared", "results")
+
+    def __init__(self, shared: Set["NodeKey"]):
+        self.shared = shared  # Digests of the nodes that are reached more than once
+        self.results: Dict[Hashable, Any] = {}
 
 
-@dataclass
 class SwungdashContext:
+    """Settings and shared state of a resolution
+
+    Contexts are read-only, so that child contexts can share everything they don't change with
+    their parents. Derive child contexts with `Context(...)` or `replace`. Note that mutable
+    values within the context, such as the cache, are shared.
+
+    Floating samples are stored in `dtype`: distributions sample in it, and the floating results
+    of operations and mixtures are cast to it. Integer and boolean samples keep their type, and
+    scalar constants never widen samples.
+
+    With a `sampling` other than `"random"`, distributions that have a quantile function are
+    sampled from a quasi-Monte Carlo or Latin hypercube `design` instead.
+
+    Resolutions stop with a `CancelledError` at the next node once the `cancelled` event is set.
+
+    The outermost resolution sets a `memo` for the nodes it reaches more than once, so that
+    `cache` and `cache_rule` only decide what is kept after it returns, never what a model means.
+    """
+
     CACHE_RULES = {"never", "constant", "always"}
 
-    cache: Dict[Hashable, Iterable[float]] = field(default_factory=dict)
-    cache_rule: str = "constant"
-    sample_count: int = DEFAULT_SAMPLE_COUNT
+    __slots__ = (
+        "cache",
+        "cache_rule",
+        "sample_count",
+        "dtype",
+        "sampling",
+        "seed",
+        "generator",
+        "design",
+        "profiler",
+        "cancelled",
+        "memo",
+    )
+
+    cache: MutableMapping[Hashable, Iterable[float]]
+    cache_rule: str
+    sample_count: int
+    dtype: np.dtype
+    sampling: str
+    seed: np.random.SeedSequence
+    generator: np.random.Generator
+    design: Optional[Design]
+    profiler: Optional["Profiler"]
+    cancelled: Optional[threading.Event]
+    memo: Optional[Memo]
+
+    def __init__(
+        self,
+        cache: Optional[MutableMapping[Hashable, Iterable[float]]] = None,
+        cache_rule: str = "constant",
+        sample_count: int = DEFAULT_SAMPLE_COUNT,
+        dtype: Any = np.float64,
+        sampling: str = "random",
+        seed: Union[None, int, np.random.SeedSequence] = None,
+        generator: Optional[np.random.Generator] = None,
+        profiler: Optional["Profiler"] = None,
+        cancelled: Optional[threading.Event] = None,
+    ):
+        self._initialize(
+            cache=SampleCache() if cache is None else cache,
+            cache_rule=cache_rule,
+            sample_count=sample_count,
+            dtype=dtype,
+            sampling=sampling,
+            seed=seed,
+            generator=generator,
+            profiler=profiler,
+            cancelled=cancelled,
+            memo=None,
+        )
+
+    def _initialize(self, **fields: Any):
+        if "cache_rule" in fields and fields["cache_rule"] not in self.CACHE_RULES:
+            raise ValueError(f"Cache rule must be one of {sorted(self.CACHE_RULES)}")
+        if "sampling" in fields and fields["sampling"] not in SAMPLINGS:
+            raise ValueError(f"Sampling must be one of {sorted(SAMPLINGS)}")
+        if "dtype" in fields:
+            fields["dtype"] = np.dtype(fields["dtype"])
+            if fields["dtype"].kind != "f":
+                raise ValueError("Samples must have a floating point dtype")
+        if "seed" in fields:
+            if not isinstance(fields["seed"], np.random.SeedSequence):
+                fields["seed"] = np.random.SeedSequence(fields["seed"])
+            if fields.get("generator") is None:  # Derive a new stream from the new seed
+                fields["generator"] = np.random.Generator(np.random.PCG64(fields["seed"]))
+        if "sampling" in fields or "seed" in fields:  # A new design for the new stream
+            sampling = fields.get("sampling", getattr(self, "sampling", "random"))
+            generator = fields["generator"] if "generator" in fields else self.generator
+            fields["design"] = None if sampling == "random" else Design(sampling, generator)
+        for name, value in fields.items():
+            _setattr(self, name, value)
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError(f"{type(self).__name__} is read-only, derive a new one with Context")
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def replace(self, **changes: Any) -> "SwungdashContext":
+        """Return a child context that shares all but the changed fields with this one"""
+        if not changes.keys() <= _FIELDS:
+            unknown = ", ".join(sorted(changes.keys() - _FIELDS))
+            raise TypeError(f"Unknown context fields: {unknown}")
+        child = _new(SwungdashContext)
+        for name in self.__slots__:
+            _setattr(child, name, getattr(self, name))
+        child._initialize(**changes)  # pylint: disable=protected-access
+        return child
+
+    def spawn(self, count: int) -> List[np.random.SeedSequence]:
+        """Return seeds for statistically independent streams, e.g., for parallel workers"""
+        return self.seed.spawn(count)
+
+
+_FIELDS = frozenset(SwungdashContext.__slots__)
+_new = object.__new__
+_setattr = object.__setattr__
 
 
 class Context:
-    context = contextvars.ContextVar("swungdash_context")
+    context: "contextvars.ContextVar[SwungdashContext]" = contextvars.ContextVar(
+        "swungdash_context"
+    )
 
     def __init__(self, **kwargs: Any):
         self.kwargs = kwargs
-        self.saved_context: Optional[SwungdashContext] = None
-        self.new_context: Optional[SwungdashContext] = None
+        self.tokens: List["contextvars.Token[SwungdashContext]"] = []
 
     @classmethod
-    def getcontext(cls):
-        try:
-            return cls.context.get()
-        except LookupError:
+    def getcontext(cls) -> SwungdashContext:
+        """Return the current context for reading, which is cheap"""
+        context = cls.context.get(None)
+        if context is None:
             context = SwungdashContext()
             cls.context.set(context)
-            return context
+        return context
 
     @classmethod
     def setcontext(cls, context: SwungdashContext):
         cls.context.set(context)
 
-    def __enter__(self):
-        self.saved_context = self.getcontext()
-        context_vars = vars(self.saved_context)  # Returns original __dict__, not a copy
-        context_vars = dict(context_vars, **self.kwargs)
-        # Note that mutable values within the context are the same
-        self.new_context = SwungdashContext(**context_vars)
-        self.setcontext(self.new_context)
-        return self.new_context
+    def __enter__(self) -> SwungdashContext:
+        context = self.getcontext()
+        if self.kwargs:
+            context = context.replace(**self.kwargs)
+        # Stack tokens, so that the same instance can be entered repeatedly
+        self.tokens.append(self.context.set(context))
+        return context
 
     def __exit__(self, *_):
-        if self.saved_context:
-            self.setcontext(self.saved_context)
+        self.context.reset(self.tokens.pop())
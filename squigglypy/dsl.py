@@ -1,33 +1,110 @@
-from typing import Callable, Optional, Sequence, Union
+from typing import Any, Callable, Optional, Sequence, Union
 import numpy as np
 
 from .resolvers import Integral
-from .tree import BaseValue, Distribution, Mixture
+from .stats import SampleSketch, sketched
+from .tree import BaseValue, Distribution, Elementwise, Mixture, Product, Reduction, Sum, Value
 
 
-def uniform(*args: float, name: Optional[str] = None):
-    return Distribution(np.random.uniform, *args, name=name)
+def uniform(*args: Union[float, BaseValue], name: Optional[str] = None):
+    return Distribution(np.random.Generator.uniform, *args, name=name)
 
 
-def normal(*args: float, name: Optional[str] = None):
-    return Distribution(np.random.normal, *args, name=name)
+def normal(*args: Union[float, BaseValue], name: Optional[str] = None):
+    return Distribution(np.random.Generator.normal, *args, name=name)
 
 
-def lognormal(*args: float, name: Optional[str] = None):
-    return Distribution(np.random.lognormal, *args, name=name)
+def lognormal(*args: Union[float, BaseValue], name: Optional[str] = None):
+    return Distribution(np.random.Generator.lognormal, *args, name=name)
 
 
-def pareto(*args: float, name: Optional[str] = None):
-    return Distribution(np.random.pareto, *args, name=name)
+def pareto(*args: Union[float, BaseValue], name: Optional[str] = None):
+    return Distribution(np.random.Generator.pareto, *args, name=name)
 
 
-def mixture(values: Sequence[BaseValue], name: Optional[str] = None):
-    return Mixture(values, name=name)
+def from_sketch(sketch: SampleSketch, name: Optional[str] = None):
+    """Return a distribution that resamples a sketch by inverse CDF"""
+    return Distribution(sketched, sketch, name=name)
+
+
+def mixture(
+    values: Sequence[BaseValue],
+    name: Optional[str] = None,
+    weights: Optional[Sequence[float]] = None,
+):
+    return Mixture(values, name=name, weights=weights)
+
+
+def _reduction(
+    reduction: Callable[[Sequence[BaseValue]], Reduction],
+    identity: float,
+    values: Sequence[Union[float, BaseValue]],
+    name: Optional[str],
+):
+    terms = [value if isinstance(value, BaseValue) else Value(value) for value in values]
+    if not terms:
+        return Value(identity, name=name)
+    if len(terms) == 1:
+        return terms[0] if name is None else Value(terms[0], name=name)
+    return Value(reduction(terms), name=name)
+
+
+def sum_of(values: Sequence[Union[float, BaseValue]], name: Optional[str] = None):
+    return _reduction(Sum, 0, values, name)
+
+
+def product_of(values: Sequence[Union[float, BaseValue]], name: Optional[str] = None):
+    return _reduction(Product, 1, values, name)
+
+
+def _elementwise(function: Callable[..., Any], *values: Union[float, BaseValue]):
+    return Value(
+        Elementwise(
+            function,
+            *(value if isinstance(value, BaseValue) else Value(value) for value in values),
+        )
+    )
+
+
+def exp(value: Union[float, BaseValue]):
+    return _elementwise(np.exp, value)
+
+
+def log(value: Union[float, BaseValue]):
+    return _elementwise(np.log, value)
+
+
+def sqrt(value: Union[float, BaseValue]):
+    return _elementwise(np.sqrt, value)
+
+
+def maximum(this: Union[float, BaseValue], other: Union[float, BaseValue]):
+    return _elementwise(np.maximum, this, other)
+
+
+def minimum(this: Union[float, BaseValue], other: Union[float, BaseValue]):
+    return _elementwise(np.minimum, this, other)
+
+
+def clip(
+    value: Union[float, BaseValue], low: Union[float, BaseValue], high: Union[float, BaseValue]
+):
+    return _elementwise(np.clip, value, low, high)
+
+
+def where(
+    condition: Union[bool, BaseValue],
+    this: Union[float, BaseValue],
+    other: Union[float, BaseValue],
+):
+    """Take `this` where the condition holds and `other` elsewhere, sample by sample"""
+    return _elementwise(np.where, condition, this, other)
 
 
 def integral(
     integrand: Callable[[Union[float, BaseValue]], Union[float, BaseValue]],
     low: float,
     high: float,
+    batched: bool = True,
 ):
-    return Integral(integrand, low, high)
+    return Integral(integrand, low, high, batched=batched)
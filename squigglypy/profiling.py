@@ -0,0 +1,165 @@
+import json
+import threading
+from collections import defaultdict
+from time import perf_counter
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from .cache import nbytes
+from .context import CacheKey
+from .tree import Resolveable, Value
+
+
+class NodeProfile:
+    __slots__ = ("node", "calls", "seconds", "own_seconds", "nbytes")
+
+    def __init__(self, node: Resolveable):
+        self.node = node
+        self.calls = 0
+        self.seconds = 0.0  # Including the nodes beneath it
+        self.own_seconds = 0.0
+        self.nbytes = 0  # Of the results that weren't cached
+
+
+class CacheProfile:
+    __slots__ = ("node", "hits", "misses")
+
+    def __init__(self, node: Resolveable):
+        self.node = node
+        self.hits = 0
+        self.misses = 0
+
+
+def _label(node: Resolveable, width: Optional[int] = None) -> str:
+    label = " ".join(repr(node).split())
+    if width is not None and len(label) > width:
+        return label[: width - 1] + "…"
+    return label
+
+
+class Profiler:
+    """Record where the time of resolutions goes
+
+    Attach a profiler to a context to record the calls, wall time, and result sizes of every
+    node that is resolved in it, and the cache hits and misses of every cache key:
+
+        with Context(profiler=Profiler()) as context:
+            ~model
+        print(context.profiler.report())
+    """
+
+    def __init__(self):
+        self.nodes: Dict[int, NodeProfile] = {}
+        self.cache: Dict[Hashable, CacheProfile] = {}
+        self.stacks: Dict[Tuple[int, ...], float] = defaultdict(float)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _stack(self) -> List[List[Any]]:
+        try:
+            return self.local.stack
+        except AttributeError:
+            self.local.stack = []
+            return self.local.stack
+
+    def measure(
+        self,
+        node: Resolveable,
+        resolve: Callable[[], Any],
+        result: Callable[[Any], Any] = lambda result: result,
+    ) -> Any:
+        """Resolve a node and record the time it took and the size of the `result`"""
+        if isinstance(node, Value) and isinstance(node.value, Resolveable):
+            return resolve()  # Only a wrapper, so profile the wrapped node instead
+        stack = self._stack()
+        # The node, the time spent on the nodes beneath it, and whether it came from the cache
+        frame = [id(node), 0.0, False]
+        stack.append(frame)
+        start = perf_counter()
+        try:
+            resolution = resolve()
+        finally:
+            seconds = perf_counter() - start
+            path = tuple(frame_[0] for frame_ in stack)
+            stack.pop()
+            if stack:
+                stack[-1][1] += seconds
+            with self.lock:
+                profile = self.nodes.get(id(node))
+                if profile is None:
+                    profile = self.nodes[id(node)] = NodeProfile(node)
+                profile.calls += 1
+                profile.seconds += seconds
+                profile.own_seconds += seconds - frame[1]
+                self.stacks[path] += seconds - frame[1]
+        if not frame[2]:
+            profile.nbytes += nbytes(result(resolution))
+        return resolution
+
+    def count(self, node: Resolveable, cache_key: Hashable, hit: bool):
+        stack = self._stack()
+        if hit and stack and stack[-1][0] == id(node):
+            stack[-1][2] = True
+        with self.lock:
+            profile = self.cache.get(cache_key)
+            if profile is None:
+                profile = self.cache[cache_key] = CacheProfile(node)
+            if hit:
+                profile.hits += 1
+            else:
+                profile.misses += 1
+
+    def as_dict(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {
+            "nodes": [
+                {
+                    "node": _label(profile.node),
+                    "calls": profile.calls,
+                    "seconds": profile.seconds,
+                    "own_seconds": profile.own_seconds,
+                    "nbytes": profile.nbytes,
+                }
+                for profile in self.nodes.values()
+            ],
+            "cache": [
+                {
+                    "node": _label(profile.node),
+                    "sample_count": (
+                        cache_key.sample_count if isinstance(cache_key, CacheKey) else None
+                    ),
+                    "hits": profile.hits,
+                    "misses": profile.misses,
+                }
+                for cache_key, profile in self.cache.items()
+            ],
+        }
+
+    def to_json(self, **kwargs: Any) -> str:
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def folded(self) -> str:
+        """Return the own time of every stack in microseconds in the folded format of flamegraphs"""
+        labels = {
+            id_: _label(profile.node).replace(";", ",") for id_, profile in self.nodes.items()
+        }
+        return "\n".join(
+            f"{';'.join(labels[id_] for id_ in path)} {round(seconds * 1e6)}"
+            for path, seconds in self.stacks.items()
+        )
+
+    def report(self, limit: Optional[int] = 20, width: int = 60) -> str:
+        """Return a table of the nodes that took the most time themselves, and of cache usage"""
+        profiles = sorted(self.nodes.values(), key=lambda profile: -profile.own_seconds)
+        lines = [f"{'calls':>8} {'total (s)':>10} {'own (s)':>10} {'bytes':>12}  node"]
+        lines.extend(
+            f"{profile.calls:>8} {profile.seconds:>10.6f} {profile.own_seconds:>10.6f} "
+            f"{profile.nbytes:>12}  {_label(profile.node, width)}"
+            for profile in profiles[:limit]
+        )
+        caches = sorted(self.cache.values(), key=lambda profile: -profile.misses)
+        lines.append("")
+        lines.append(f"{'hits':>8} {'misses':>10}  cached node")
+        lines.extend(
+            f"{profile.hits:>8} {profile.misses:>10}  {_label(profile.node, width)}"
+            for profile in caches[:limit]
+        )
+        return "\n".join(lines)
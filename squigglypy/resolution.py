@@ -0,0 +1,189 @@
+import numbers
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import reduce
+from math import ceil, floor, sqrt
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+
+from .context import Context, SwungdashContext, split_sample_count
+from .stats import Histogram, Moments, TDigest
+from .tree import Resolveable
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+Accumulator = Union[Histogram, Moments, TDigest]
+Statistic = Union[str, float, Callable[[np.ndarray], float]]
+
+# Context fields that are process-local state rather than settings
+_STATE = {"cache", "sample_count", "seed", "generator", "design", "profiler", "cancelled", "memo"}
+
+
+def _settings(context: SwungdashContext) -> Dict[str, Any]:
+    return {name: getattr(context, name) for name in context.__slots__ if name not in _STATE}
+
+
+def _resolve_shard(
+    value: Resolveable,
+    sample_count: int,
+    seed: np.random.SeedSequence,
+    settings: Dict[str, Any],
+    statistics: bool,
+) -> Union[np.ndarray, Moments]:
+    with Context(cache={}, sample_count=sample_count, seed=seed, **settings):
+        samples = np.broadcast_to(~value, (sample_count,))
+    if statistics:
+        return Moments().update(samples)
+    return samples
+
+
+def resolve_parallel(
+    value: Resolveable,
+    workers: Optional[int] = None,
+    shards: Optional[int] = None,
+    statistics: bool = False,
+    executor: Optional[Executor] = None,
+) -> Union[np.ndarray, Moments]:
+    """Resolve a value in shards on a process pool
+
+    Each shard resolves the whole tree with its share of the sample count, a fresh cache, and an
+    independent stream spawned from the seed of the current context, so results are reproducible
+    for a given seed and shard count. With `statistics`, shards are reduced to `Moments` in the
+    workers and only those are sent back.
+    """
+    context = Context.getcontext()
+    settings = _settings(context)
+    shards = shards or workers or 1
+    sample_counts = split_sample_count(context.sample_count, shards)
+    seeds = context.spawn(shards)
+    pool = executor or ProcessPoolExecutor(max_workers=workers)
+    try:
+        results: List[Any] = list(
+            pool.map(
+                _resolve_shard,
+                [value] * shards,
+                sample_counts,
+                seeds,
+                [settings] * shards,
+                [statistics] * shards,
+            )
+        )
+    finally:
+        if executor is None:
+            pool.shutdown()
+    if statistics:
+        return reduce(Moments.merge, results, Moments())
+    return np.concatenate(results)
+
+
+def stream(value: Resolveable, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[np.ndarray]:
+    """Resolve the sample count of the current context in chunks of at most `chunk_size`
+
+    Every chunk has a fresh cache, so distributions that occur several times in the tree are
+    sampled once per chunk, and an independent stream spawned from the seed of the context.
+    """
+    context = Context.getcontext()
+    settings = _settings(context)
+    sample_count = context.sample_count
+    while sample_count > 0:
+        (seed,) = context.spawn(1)
+        chunk = min(chunk_size, sample_count)
+        sample_count -= chunk
+        samples = _resolve_shard(value, chunk, seed, settings, statistics=False)
+        assert isinstance(samples, np.ndarray)
+        yield samples
+
+
+def summarize(
+    value: Resolveable, *accumulators: Accumulator, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Sequence[Accumulator]:
+    """Feed streamed chunks into online accumulators in bounded memory
+
+    Defaults to `Moments` if no accumulators are given.
+    """
+    accumulators = accumulators or (Moments(),)
+    for chunk in stream(value, chunk_size):
+        for accumulator in accumulators:
+            accumulator.update(chunk)
+    return accumulators
+
+
+class Estimate(NamedTuple):
+    value: float
+    error: float  # The standard error of the value
+    samples: np.ndarray
+    converged: bool  # Whether the error is within the tolerance
+
+
+def _estimate(
+    samples: np.ndarray, statistic: Statistic, generator: np.random.Generator, resamples: int
+) -> Tuple[float, float]:
+    """Return a statistic of the samples and its standard error"""
+    count = samples.size
+    if isinstance(statistic, str):
+        return float(samples.mean()), float(samples.std(ddof=1)) / sqrt(count)
+    if isinstance(statistic, numbers.Real):
+        # The order statistics one binomial standard deviation of ranks around the quantile
+        spread = sqrt(count * statistic * (1 - statistic))
+        low = max(floor(count * statistic - spread), 0)
+        high = min(ceil(count * statistic + spread), count - 1)
+        partitioned = np.partition(samples, (low, high))
+        estimate = float(np.quantile(samples, statistic))
+        return estimate, float(partitioned[high] - partitioned[low]) / 2
+    assert callable(statistic)
+    replicates = [
+        statistic(samples[generator.integers(count, size=count)]) for _ in range(resamples)
+    ]
+    return float(statistic(samples)), float(np.std(replicates, ddof=1))
+
+
+def resolve_until(
+    value: Resolveable,
+    statistic: Statistic = "mean",
+    rel_tol: float = 0.01,
+    abs_tol: float = 0.0,
+    max_samples: int = 10_000_000,
+    resamples: int = 200,
+) -> Estimate:
+    """Resolve a value in growing batches until a statistic of it is precise enough
+
+    The statistic is the `"mean"`, a quantile given as a number between 0 and 1, or a function of
+    the samples, whose standard error is bootstrapped from `resamples` resamples. Resolution stops
+    once the standard error is at most `rel_tol` times the absolute estimate or `abs_tol`, or
+    once `max_samples` have been resolved. The first batch has the sample count of the current
+    context, and every further batch doubles the total.
+
+    Every batch has a fresh cache, so distributions that occur several times in the tree are
+    sampled once per batch, and an independent stream spawned from the seed of the context, so
+    results are reproducible for a given seed.
+    """
+    if isinstance(statistic, str) and statistic != "mean":
+        raise ValueError(f"Unknown statistic {statistic!r}")
+    if isinstance(statistic, numbers.Real) and not 0 < statistic < 1:
+        raise ValueError(f"Quantiles must be between 0 and 1, not {statistic}")
+    context = Context.getcontext()
+    settings = _settings(context)
+    (seed,) = context.spawn(1)
+    generator = np.random.default_rng(seed)
+    samples = np.empty(0, context.dtype)
+    while True:
+        (seed,) = context.spawn(1)
+        batch = min(max(samples.size, context.sample_count, 2), max_samples - samples.size)
+        samples = np.concatenate(
+            [samples, _resolve_shard(value, batch, seed, settings, statistics=False)]
+        )
+        estimate, error = _estimate(samples, statistic, generator, resamples)
+        converged = error <= max(rel_tol * abs(estimate), abs_tol)
+        if converged or samples.size >= max_samples:
+            return Estimate(estimate, error, samples, bool(converged))
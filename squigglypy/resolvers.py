@@ -1,13 +1,52 @@
-from typing import Callable, Tuple, Union
+from typing import Callable, Optional, Tuple, Union
 
+import numpy as np
 from scipy.integrate import quad  # type: ignore
 
-from .context import Context
+from .context import Context, NodeKey
 from .tree import BaseValue, Resolveable
-from .utils import aslist
+from .utils import mark_constancy
 
 quad: Callable[..., Tuple[float, float]]
 
+# Gauss–Kronrod 7–15 rule on [-1, 1], as in QUADPACK's QK15
+_KRONROD_NODES = np.array(
+    [
+        0.991455371120812639206854697526329,
+        0.949107912342758524526189684047851,
+        0.864864423359769072789712788640926,
+        0.741531185599394439863864773280788,
+        0.586087235467691130294144845693013,
+        0.405845151377397166906606412076961,
+        0.207784955007898467600689403773245,
+        0.000000000000000000000000000000000,
+    ]
+)
+_KRONROD_WEIGHTS = np.array(
+    [
+        0.022935322010529224963732008058970,
+        0.063092092629978553290700663189204,
+        0.104790010322250183839876322541518,
+        0.140653259715525918745189590510238,
+        0.169004726639267902826583426598550,
+        0.190350578064785409913256402421014,
+        0.204432940075298892414161999234649,
+        0.209482141084727828012999174891714,
+    ]
+)
+_GAUSS_WEIGHTS = np.array(
+    [
+        0.129484966168869693270611432679082,
+        0.279705391489276667901467771423780,
+        0.381830050505118944950369775488975,
+        0.417959183673469387755102040816327,
+    ]
+)
+NODES = np.concatenate([-_KRONROD_NODES[:-1], _KRONROD_NODES[::-1]])
+KRONROD_WEIGHTS = np.concatenate([_KRONROD_WEIGHTS[:-1], _KRONROD_WEIGHTS[::-1]])
+GAUSS_WEIGHTS = np.zeros_like(KRONROD_WEIGHTS)
+GAUSS_WEIGHTS[1::2] = np.concatenate([_GAUSS_WEIGHTS[:-1], _GAUSS_WEIGHTS[::-1]])
+
 
 class Integral(Resolveable):
     def __init__(
@@ -15,10 +54,20 @@ class Integral(Resolveable):
         integrand: Callable[[Union[float, BaseValue]], Union[float, BaseValue]],
         low: float,
         high: float,
+        batched: bool = True,
+        epsabs: float = 1.49e-8,
+        epsrel: float = 1.49e-8,
+        limit: int = 50,
     ):
         self.integrand = integrand
         self.low = low
         self.high = high
+        self.batched = batched
+        self.epsabs = epsabs
+        self.epsrel = epsrel
+        self.limit = limit
+        # The integrand is an arbitrary callable whose result can't be identified structurally
+        self.digest = NodeKey.unique(Integral, integrand, low, high, volatile=True)
 
     def _integrand_wrapper(self, x: float):
         result = self.integrand(x)
@@ -26,10 +75,101 @@ class Integral(Resolveable):
             return ~result
         return result
 
-    @aslist
-    def _resolve(self):
-        with Context() as context:
-            for _ in range(context.sample_count):
-                with Context(cache={}, sample_count=1) as context:
-                    integral, _ = quad(self._integrand_wrapper, self.low, self.high)
+    def _substitution(self) -> Tuple[float, float, Callable[[np.ndarray], Tuple[np.ndarray, ...]]]:
+        """Return bounds and a map to finite bounds along with its derivative"""
+        low, high = self.low, self.high
+        if np.isfinite(low) and np.isfinite(high):
+            return low, high, lambda t: (t, np.ones_like(t))
+        if np.isfinite(low):
+            return 0, 1, lambda t: (low + t / (1 - t), 1 / (1 - t) ** 2)
+        if np.isfinite(high):
+            return 0, 1, lambda t: (high - (1 - t) / t, 1 / t ** 2)
+        return -1, 1, lambda t: (t / (1 - t ** 2), (1 + t ** 2) / (1 - t ** 2) ** 2)
+
+    def _batched(self, sample_count: int) -> Optional[np.ndarray]:
+        """Integrate all samples at once with adaptive Gauss–Kronrod quadrature
+
+        The integrand is traced once and evaluated over a `(nodes × samples)` grid. Subtrees that
+        don't depend on the integration variable are cached and so sampled only once. Returns
+        `None` if the integrand can't be traced or the quadrature doesn't converge.
+        """
+        try:
+            tree, tracer = mark_constancy(self.integrand)
+        except (TypeError, ValueError, AttributeError):
+            return None
+
+        if not isinstance(tree, BaseValue):
+            # The integrand doesn't depend on any distribution, so all samples are the same
+            integral, _ = quad(self.integrand, self.low, self.high)
+            return np.full(sample_count, integral)
+
+        def evaluate(xs: np.ndarray) -> np.ndarray:
+            tracer.value = xs[:, np.newaxis]
+            return np.broadcast_to(~tree, (len(xs), sample_count))
+
+        low, high, substitute = self._substitution()
+        # Spot check that tracing didn't lose any control flow that depends on the variable
+        probe, _ = substitute(np.array([low + (high - low) / 3]))
+        try:
+            if not np.allclose(
+                evaluate(probe)[0], self._integrand_wrapper(probe[0]), rtol=1e-9, equal_nan=True
+            ):
+                return None
+        except (TypeError, ValueError, AttributeError):
+            return None
+
+        done, done_errors = np.zeros(sample_count), np.zeros(sample_count)
+        bounds = np.array([[low, high]], dtype=float)
+        for _ in range(self.limit):
+            centers = bounds.mean(axis=1)[:, np.newaxis]
+            halves = (bounds[:, 1] - bounds[:, 0])[:, np.newaxis] / 2
+            xs, derivatives = substitute(centers + halves * NODES)
+            ys = evaluate(xs.ravel()).reshape(*xs.shape, sample_count)
+            ys = ys * (derivatives * halves)[..., np.newaxis]
+            kronrod = np.einsum("ins,n->is", ys, KRONROD_WEIGHTS)
+            errors = np.abs(kronrod - np.einsum("ins,n->is", ys, GAUSS_WEIGHTS))
+            total = done + kronrod.sum(axis=0)
+            tolerance = np.maximum(self.epsabs, self.epsrel * np.abs(total))
+            if (done_errors + errors.sum(axis=0) <= tolerance).all():
+                return total
+            # Bisect intervals whose error exceeds their share of the tolerance for any sample
+            share = (bounds[:, 1] - bounds[:, 0])[:, np.newaxis] / (high - low)
+            refine = (errors > tolerance * share).any(axis=1)
+            done += kronrod[~refine].sum(axis=0)
+            done_errors += errors[~refine].sum(axis=0)
+            centers = centers[refine, 0]
+            bounds = np.concatenate(
+                [
+                    np.stack([bounds[refine, 0], centers], axis=1),
+                    np.stack([centers, bounds[refine, 1]], axis=1),
+                ]
+            )
+        return None
+
+    def _quad(self, sample_count: int) -> np.ndarray:
+        def integrals():
+            for _ in range(sample_count):
+                with Context(
+                    cache={}, cache_rule="constant", memo=None, sample_count=1, dtype=np.float64
+                ):
+                    integral, _ = quad(
+                        lambda x: np.asarray(self._integrand_wrapper(x)).item(),
+                        self.low,
+                        self.high,
+                    )
                     yield integral
+
+        return np.fromiter(integrals(), dtype=float, count=sample_count)
+
+    def _resolve(self):
+        context = Context.getcontext()
+        # Whatever the outer cache rule, every evaluation of the integrand must reuse the samples
+        # of its constant parts and recompute those that depend on the variable, so both paths
+        # cache by the "constant" rule and start a memo per evaluation
+        if self.batched:
+            # Integrate in double precision, lest the tolerances be unattainable
+            with Context(cache={}, cache_rule="constant", memo=None, dtype=np.float64):
+                integrals = self._batched(context.sample_count)
+            if integrals is not None:
+                return integrals.astype(context.dtype, copy=False)
+        return self._quad(context.sample_count).astype(context.dtype, copy=False)
@@ -0,0 +1,111 @@
+import threading
+from typing import Dict, Hashable, Iterable, List, Union
+
+import numpy as np
+from scipy.stats import qmc  # type: ignore
+
+SAMPLINGS = {"random", "sobol", "halton", "latin"}
+
+_BITS = 30  # Of the Sobol' points that SciPy generates by default
+
+
+class Design:
+    """Uniforms for quasi-Monte Carlo and Latin hypercube sampling
+
+    Every leaf, identified by its digest, is assigned its own dimension of the design in the order
+    in which leaves are first sampled. Sobol' and Halton columns are taken from unscrambled
+    sequences, so that they stay the same as the design grows by dimensions, and randomized per
+    dimension with a random digital shift and a random shift modulo 1, respectively. Latin
+    hypercube columns are independent stratified permutations.
+
+    Columns are computed one dimension at a time, Sobol' columns from the direction numbers of
+    their dimension and Halton columns as radical inverses in the prime of their dimension, so a
+    design never holds the points of more than the column it returns.
+    """
+
+    def __init__(self, sampling: str, generator: np.random.Generator):
+        if sampling not in SAMPLINGS - {"random"}:
+            raise ValueError(f"Sampling must be one of {sorted(SAMPLINGS - {'random'})}")
+        self.sampling = sampling
+        self.generator = generator
+        self.dimensions: Dict[Hashable, int] = {}
+        self.shifts: List[Union[np.uint64, float]] = []
+        # Sobol' direction numbers as integers of `_BITS` bits, by dimension and bit
+        self.directions = np.zeros((0, 0), dtype=np.uint64)
+        self.primes: List[int] = []  # The bases of the Halton dimensions
+        self.lock = threading.RLock()
+
+    def _dimension(self, digest: Hashable) -> int:
+        dimension = self.dimensions.get(digest)
+        if dimension is None:
+            dimension = self.dimensions[digest] = len(self.dimensions)
+            if self.sampling == "sobol":
+                self.shifts.append(self.generator.integers(2 ** _BITS, dtype=np.uint64))
+            else:
+                self.shifts.append(self.generator.random())
+        return dimension
+
+    def _directions(self, dimensions: int, bits: int) -> np.ndarray:
+        """Return the direction numbers of the first `bits` bits of the first dimensions"""
+        if self.directions.shape[0] < dimensions or self.directions.shape[1] < bits:
+            # Grow geometrically, so that the cost of regenerating stays linear in the dimensions
+            dimensions = max(dimensions, 2 * self.directions.shape[0])
+            bits = max(bits, self.directions.shape[1])
+            # In Gray code order, the point at 2 ** (bit + 1) - 1 is the direction number of bit
+            sequence = qmc.Sobol(dimensions, scramble=False)
+            rows = []
+            for bit in range(bits):
+                sequence.fast_forward(2 ** (bit + 1) - 1 - sequence.num_generated)
+                rows.append(sequence.random(1)[0] * 2 ** _BITS)
+            self.directions = np.array(rows, dtype=np.uint64).T
+        return self.directions
+
+    def _prime(self, dimension: int) -> int:
+        candidate = self.primes[-1] + 1 if self.primes else 2
+        while len(self.primes) <= dimension:
+            if all(candidate % prime for prime in self.primes):
+                self.primes.append(candidate)
+            candidate += 1
+        return self.primes[dimension]
+
+    def _column(self, dimension: int, sample_count: int) -> np.ndarray:
+        """Return the points of a dimension, as integers of `_BITS` bits for Sobol' designs"""
+        indices = np.arange(sample_count, dtype=np.uint64)
+        if self.sampling == "sobol":
+            bits = max(int(sample_count - 1).bit_length(), 1)
+            directions = self._directions(dimension + 1, bits)[dimension]
+            gray = indices ^ (indices >> np.uint64(1))
+            column = np.zeros(sample_count, dtype=np.uint64)
+            for bit in range(bits):
+                column ^= ((gray >> np.uint64(bit)) & np.uint64(1)) * directions[bit]
+            return column
+        base = self._prime(dimension)
+        inverse = np.zeros(sample_count)  # Radical inverse of the indices
+        scale = 1.0 / base
+        while indices.any():
+            inverse += (indices % base) * scale
+            indices //= np.uint64(base)
+            scale /= base
+        return inverse
+
+    def reserve(self, digests: Iterable[Hashable]):
+        """Assign dimensions to leaves in the given order rather than in the order of sampling
+
+        Leaves that are sampled concurrently would otherwise get their dimensions, and with them
+        their shifts, in whichever order the threads happen to run.
+        """
+        with self.lock:
+            for digest in digests:
+                self._dimension(digest)
+
+    def uniforms(self, digest: Hashable, sample_count: int) -> np.ndarray:
+        """Return the uniforms of a leaf, which lie strictly between 0 and 1"""
+        if self.sampling == "latin":
+            strata = self.generator.permutation(sample_count)
+            return (strata + self.generator.random(sample_count)) / sample_count
+        with self.lock:
+            dimension = self._dimension(digest)
+            column = self._column(dimension, sample_count)
+        if self.sampling == "sobol":
+            return ((column ^ self.shifts[dimension]) + 0.5) / 2 ** _BITS
+        return (column + self.shifts[dimension]) % 1.0
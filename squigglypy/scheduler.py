@@ -0,0 +1,225 @@
+import contextvars
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    CancelledError,
+    Executor,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .context import Context, NodeKey, SwungdashContext
+from .sampling import Design
+from .tree import (
+    Distribution,
+    Elementwise,
+    Mixture,
+    Operation,
+    Plan,
+    Reduction,
+    Resolveable,
+    _instruction,
+    _operands,
+    _unwrap,
+)
+from .utils import _bfs
+
+
+class _Task(NamedTuple):
+    node: Resolveable
+    # Computes the result from the context of the task and the results of the dependencies
+    run: Callable[[SwungdashContext, List[Any]], Any]
+    dependencies: Tuple[int, ...]
+    memoize: bool  # Whether the result is that of the node, rather than a part of it
+
+
+def _compute(node: Resolveable, operands: int) -> Callable[[SwungdashContext, List[Any]], Any]:
+    instruction = _instruction(node, tuple(range(operands)))
+
+    def run(context: SwungdashContext, results: List[Any]) -> Any:
+        # Results are shared with other tasks and the cache, so never write into them
+        # pylint: disable=protected-access
+        return Plan._apply(instruction, results, [False] * operands, {}, context.dtype)[0]
+
+    return run
+
+
+def _load(node: Resolveable) -> Callable[[SwungdashContext, List[Any]], Any]:
+    return lambda context, results: ~node
+
+
+def _draw(node: Distribution) -> Callable[[SwungdashContext, List[Any]], Any]:
+    return node._draw  # pylint: disable=protected-access
+
+
+def _allocate(node: Mixture) -> Callable[[SwungdashContext, List[Any]], Any]:
+    return lambda context, results: node._allocate(context)  # pylint: disable=protected-access
+
+
+def _component(value: Resolveable, index: int) -> Callable[[SwungdashContext, List[Any]], Any]:
+    def run(_context: SwungdashContext, results: List[Any]) -> Any:
+        sample_counts, _ = results[0]
+        if not sample_counts[index]:
+            return None
+        # Components that share parts at the same sample count would race for their samples
+        with Context(cache={}, sample_count=sample_counts[index]):
+            return ~value
+
+    return run
+
+
+def _scatter(node: Mixture) -> Callable[[SwungdashContext, List[Any]], Any]:
+    def run(context: SwungdashContext, results: List[Any]) -> Any:
+        sample_counts, order = results[0]
+        # pylint: disable=protected-access
+        return node._scatter(results[1:], sample_counts, order, context.dtype)
+
+    return run
+
+
+def _tasks(tree: Resolveable, context: SwungdashContext) -> List[_Task]:
+    """Lower a tree into a topologically ordered list of tasks
+
+    Structurally equal subtrees share a task, and cached subtrees aren't expanded. Mixtures are
+    split into a task that allocates the samples to the components, one task per component, which
+    resolves that component as a whole in a cache of its own, and a task that scatters their
+    samples.
+    """
+    # pylint: disable=protected-access
+    tasks: List[_Task] = []
+    slots: Dict[NodeKey, int] = {}
+    stack: List[Tuple[Resolveable, Optional[List[Resolveable]]]] = [(_unwrap(tree), None)]
+    while stack:
+        node, children = stack.pop()
+        if node.digest in slots:
+            continue
+        cached = node._cacheable(context) and node._cache_key(context) in context.cache
+        if cached or not isinstance(node, (Operation, Reduction, Elementwise, Distribution)):
+            if isinstance(node, Mixture) and not cached:
+                allocation = len(tasks)
+                tasks.append(_Task(node, _allocate(node), (), False))
+                components = []
+                for index, value in enumerate(node.values):
+                    components.append(len(tasks))
+                    tasks.append(_Task(value, _component(value, index), (allocation,), False))
+                task = _Task(node, _scatter(node), (allocation, *components), True)
+            else:
+                task = _Task(node, _load(node), (), False)  # Memoized by resolving it
+        elif children is None:
+            if isinstance(node, Distribution):
+                children = [_unwrap(parameter) for parameter in node.parameters]
+            else:
+                children = _operands(node)  # type: ignore
+            stack.append((node, children))
+            stack.extend((child, None) for child in reversed(children))
+            continue
+        else:
+            dependencies = tuple(slots[child.digest] for child in children)
+            if isinstance(node, Distribution):
+                task = _Task(node, _draw(node), dependencies, True)
+            else:
+                task = _Task(node, _compute(node, len(children)), dependencies, True)
+        slots[node.digest] = len(tasks)
+        tasks.append(task)
+    return tasks
+
+
+def _contexts(tree: Resolveable, context: SwungdashContext, count: int) -> List[SwungdashContext]:
+    """Return a context with its own stream for every task, which depends only on the seed"""
+    (seed,) = context.spawn(1)
+    if context.design is not None and context.sampling != "latin":
+        # Sobol' and Halton designs are shared, so assign their dimensions in a fixed order
+        context.design.reserve(
+            part.digest
+            for part in _bfs(tree)
+            if isinstance(part, Distribution) and part.function in part.QUANTILES
+        )
+    contexts = []
+    for seed_ in seed.spawn(count):
+        generator = np.random.Generator(np.random.PCG64(seed_))
+        if context.sampling == "latin":  # Latin hypercubes draw from the stream of their design
+            contexts.append(
+                context.replace(generator=generator, design=Design("latin", generator))
+            )
+        else:
+            contexts.append(context.replace(generator=generator))
+    return contexts
+
+
+def _run(task: _Task, context: SwungdashContext, results: List[Any]) -> Any:
+    if context.cancelled is not None and context.cancelled.is_set():
+        raise CancelledError(f"Resolution of {task.node} was cancelled")
+    Context.setcontext(context)
+    if not task.memoize:
+        return task.run(context, results)
+    compute = lambda context: task.run(context, results)  # pylint: disable=unnecessary-lambda
+    if context.profiler is not None:
+        measured = compute
+        compute = lambda context: context.profiler.measure(task.node, lambda: measured(context))
+    if task.node._cacheable(context):  # pylint: disable=protected-access
+        return task.node._memoize(context, compute)  # pylint: disable=protected-access
+    return compute(context)
+
+
+def resolve_threaded(
+    value: Resolveable, workers: Optional[int] = None, executor: Optional[Executor] = None
+) -> Any:
+    """Resolve the independent parts of a value concurrently on a thread pool
+
+    NumPy releases the GIL in its samplers and ufuncs, so wide trees, such as mixtures of many
+    submodels or sums of many independent terms, use several cores without the costs of processes.
+    The tree is lowered into a graph of tasks, and every task is dispatched as soon as the tasks
+    it depends on are done. Every task draws from its own stream, spawned from the seed of the
+    current context by the position of the task in the graph, so results are reproducible for a
+    given seed no matter how many workers there are or in which order they run. They differ from
+    those of `~value`, which draws every leaf from the stream of the context, though.
+    """
+    context = Context.getcontext()
+    tasks = _tasks(value, context)
+    contexts = _contexts(value, context, len(tasks))
+    dependents: List[List[int]] = [[] for _ in tasks]
+    waiting = [len(task.dependencies) for task in tasks]
+    uses = [0] * len(tasks)  # By pending tasks, so that results are released when they're done
+    for index, task in enumerate(tasks):
+        for dependency in task.dependencies:
+            dependents[dependency].append(index)
+            uses[dependency] += 1
+    results: List[Any] = [None] * len(tasks)
+    pool = executor or ThreadPoolExecutor(max_workers=workers)
+    running: Dict["Future[Any]", int] = {}
+
+    def submit(index: int):
+        task = tasks[index]
+        arguments = [results[dependency] for dependency in task.dependencies]
+        # Every task runs in a fresh copy of the context variables of this thread
+        future = pool.submit(
+            contextvars.copy_context().run, _run, task, contexts[index], arguments
+        )
+        running[future] = index
+
+    try:
+        for index, task in enumerate(tasks):
+            if not task.dependencies:
+                submit(index)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = running.pop(future)
+                results[index] = future.result()
+                for dependency in tasks[index].dependencies:
+                    uses[dependency] -= 1
+                    if not uses[dependency]:
+                        results[dependency] = None
+                for dependent in dependents[index]:
+                    waiting[dependent] -= 1
+                    if not waiting[dependent]:
+                        submit(dependent)
+    finally:
+        for future in running:
+            future.cancel()
+        if executor is None:
+            pool.shutdown()
+    return results[-1]
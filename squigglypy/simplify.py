@@ -0,0 +1,308 @@
+import numbers
+import operator
+from collections import Counter
+from copy import copy
+from functools import reduce
+from math import hypot, log
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from .context import NodeKey
+from .tree import (
+    BaseValue,
+    Distribution,
+    Elementwise,
+    Mixture,
+    Operation,
+    Reduction,
+    Resolveable,
+    Sum,
+    Value,
+    _empty,
+)
+
+_NORMAL = np.random.Generator.normal
+_UNIFORM = np.random.Generator.uniform
+_LOGNORMAL = np.random.Generator.lognormal
+
+# Names of the parameters of the distributions with closed forms, all of which default to 0 and 1
+_PARAMETERS = {
+    _NORMAL: ("loc", "scale"),
+    _UNIFORM: ("low", "high"),
+    _LOGNORMAL: ("mean", "sigma"),
+}
+
+Leaf = Tuple[Any, float, float]
+
+
+def _children(node: Resolveable) -> List[Resolveable]:
+    if isinstance(node, Value) and isinstance(node.value, Resolveable):
+        return [node.value]
+    if isinstance(node, Operation):
+        return [node.this, node.other]
+    if isinstance(node, (Mixture, Reduction, Elementwise)):
+        return list(node.values)
+    if isinstance(node, Distribution):
+        return list(node.parameters)
+    return []
+
+
+def _uses(tree: Resolveable) -> Dict[NodeKey, int]:
+    """Count the structurally distinct parents of every node"""
+    parents: Dict[NodeKey, Set[NodeKey]] = {}
+    seen: Set[int] = set()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        for child in _children(node):
+            if child.digest is not node.digest:  # Values share the digests of what they wrap
+                parents.setdefault(child.digest, set()).add(node.digest)
+            stack.append(child)
+    return {digest: len(parents_) for digest, parents_ in parents.items()}
+
+
+def _scalar(node: Resolveable) -> Optional[numbers.Real]:
+    if (
+        isinstance(node, Value)
+        and node.name is None
+        and not node.digest.volatile
+        and isinstance(node.value, numbers.Real)
+    ):
+        return node.value
+    return None
+
+
+def _leaf(node: Resolveable, uses: Dict[NodeKey, int]) -> Optional[Leaf]:
+    """Return the parameters of an unnamed distribution that is used only once, if it has them"""
+    if (
+        not isinstance(node, Distribution)
+        or node.name is not None
+        or node.function not in _PARAMETERS
+        or uses.get(node.digest, 0) > 1
+        or len(node.args) > 2
+    ):
+        return None
+    parameters: Dict[str, Any] = dict(zip(_PARAMETERS[node.function], (0.0, 1.0)))
+    parameters.update(zip(_PARAMETERS[node.function], node.args))
+    for key, value in node.kwargs.items():
+        if key not in parameters:
+            return None
+        parameters[key] = value
+    first, second = parameters.values()
+    if not isinstance(first, numbers.Real) or not isinstance(second, numbers.Real):
+        return None
+    return (node.function, float(first), float(second))
+
+
+def _closed_form(function: Any, x: Any, y: Any) -> Optional[Leaf]:
+    """Return the distribution of an operation on independent leaves and scalars, if it has one
+
+    Each of `x` and `y` is either a leaf or a scalar.
+    """
+    # pylint: disable=too-many-return-statements,too-many-branches
+    if function is operator.pos and isinstance(x, tuple):
+        return x
+    if function is operator.neg and isinstance(x, tuple):
+        if x[0] is _NORMAL:
+            return (_NORMAL, -x[1], x[2])
+        if x[0] is _UNIFORM:
+            return (_UNIFORM, -x[2], -x[1])
+        return None
+    if isinstance(x, tuple) and isinstance(y, tuple):
+        if x[0] is _NORMAL and y[0] is _NORMAL and function is operator.add:
+            return (_NORMAL, x[1] + y[1], hypot(x[2], y[2]))
+        if x[0] is _NORMAL and y[0] is _NORMAL and function is operator.sub:
+            return (_NORMAL, x[1] - y[1], hypot(x[2], y[2]))
+        if x[0] is _LOGNORMAL and y[0] is _LOGNORMAL and function is operator.mul:
+            return (_LOGNORMAL, x[1] + y[1], hypot(x[2], y[2]))
+        if x[0] is _LOGNORMAL and y[0] is _LOGNORMAL and function is operator.truediv:
+            return (_LOGNORMAL, x[1] - y[1], hypot(x[2], y[2]))
+        return None
+    if isinstance(y, tuple):  # A scalar on the left
+        if function in (operator.add, operator.mul):
+            # Swapped on purpose, as addition and multiplication commute
+            return _closed_form(function, y, x)  # pylint: disable=arguments-out-of-order
+        if function is operator.sub:
+            negated = _closed_form(operator.neg, y, None)
+            return negated and _closed_form(operator.add, negated, x)
+        if function is operator.truediv and y[0] is _LOGNORMAL and x > 0:
+            return (_LOGNORMAL, log(x) - y[1], y[2])
+        return None
+    kind, first, second = x
+    if function is operator.sub:
+        function, y = operator.add, -y
+    elif function is operator.truediv and y != 0:
+        function, y = operator.mul, 1 / y
+    if kind is _NORMAL and function is operator.add:
+        return (_NORMAL, first + y, second)
+    if kind is _NORMAL and function is operator.mul:
+        return (_NORMAL, first * y, second * abs(y))
+    if kind is _UNIFORM and function is operator.add:
+        return (_UNIFORM, first + y, second + y)
+    if kind is _UNIFORM and function is operator.mul:
+        return (_UNIFORM, *sorted((first * y, second * y)))
+    if kind is _LOGNORMAL and function is operator.mul and y > 0:
+        return (_LOGNORMAL, first + log(y), second)
+    if kind is _LOGNORMAL and function is operator.pow:
+        return (_LOGNORMAL, first * y, second * abs(y))
+    return None
+
+
+def _fold(operation: Operation, this: BaseValue, other: BaseValue, uses: Dict[NodeKey, int]):
+    unary = isinstance(other, Value) and other.value is _empty
+    x: Union[None, numbers.Real, Leaf] = _scalar(this)
+    y: Union[None, numbers.Real, Leaf] = None if unary else _scalar(other)
+    if x is not None and (unary or y is not None):
+        try:
+            return Value(operation.function(x) if unary else operation.function(x, y))
+        except ArithmeticError:
+            return None
+    if not unary and this.digest is other.digest:
+        return None  # The same variable twice, so not independent
+    x = _leaf(this, uses) if x is None else x
+    y = None if unary else _leaf(other, uses) if y is None else y
+    if x is None or (y is None and not unary):
+        return None
+    leaf = _closed_form(operation.function, x, y)
+    if leaf is None:
+        return None
+    distribution = Distribution(leaf[0], leaf[1], leaf[2])
+    # It is the same random variable as the operation, so it shares the samples in the cache
+    distribution.digest = operation.digest
+    return distribution
+
+
+def _reduce(node: Reduction, terms: List[BaseValue], uses: Dict[NodeKey, int]):
+    """Combine the independent leaves of a reduction of the kind it closes over and its scalars
+
+    Normals are summed and lognormals multiplied. If a single leaf remains besides the scalars,
+    they are folded into it.
+    """
+    kind = _NORMAL if isinstance(node, Sum) else _LOGNORMAL
+    counts = Counter(term.digest for term in terms)
+    rest: List[BaseValue] = []
+    combined: List[Tuple[BaseValue, Leaf]] = []
+    scalars: List[Any] = []  # Real numbers, of whichever type they were given
+    for term in terms:
+        x = _scalar(term)
+        if x is not None:
+            scalars.append(x)
+            continue
+        leaf = _leaf(term, uses) if counts[term.digest] == 1 else None
+        if leaf is not None and leaf[0] is kind:
+            combined.append((term, leaf))
+        else:
+            rest.append(term)
+    if not combined and len(rest) == 1 and scalars:
+        leaf = _leaf(rest[0], uses) if counts[rest[0].digest] == 1 else None
+        if leaf is not None:
+            combined, rest = [(rest[0], leaf)], []
+    leaf = None
+    if combined:
+        leaf = combined[0][1]
+        for _, y in combined[1:]:
+            leaf = _closed_form(node.function, leaf, y)
+    scalar = reduce(node.function, scalars) if scalars else None
+    folded = len(combined) > 1 or len(scalars) > 1
+    if leaf is not None and scalar is not None and not rest:
+        with_scalar = _closed_form(node.function, leaf, scalar)
+        if with_scalar is not None:
+            leaf, scalar, folded = with_scalar, None, True
+    if not folded:
+        return None
+    if leaf is not None:
+        distribution = Distribution(leaf[0], leaf[1], leaf[2])
+        if not rest and scalar is None:
+            distribution.digest = node.digest  # The same random variable as the reduction
+        else:  # The same random variable as the reduction of the combined terms
+            digests = [term.digest for term, _ in combined]
+            distribution.digest = reduce(
+                lambda x, y: NodeKey.intern(type(node), x, y), digests[1:], digests[0]
+            )
+        rest.append(distribution)
+    if scalar is not None:
+        rest.append(Value(scalar))
+    if len(rest) == 1:
+        return rest[0]
+    return type(node)(rest)
+
+
+def _rename(node: BaseValue, name: Optional[str]) -> BaseValue:
+    if name is None or node.name == name:
+        return node
+    renamed = copy(node)
+    renamed.name = name
+    return renamed
+
+
+def _rewrite(node: Resolveable, children: List[Any], uses: Dict[NodeKey, int]) -> Any:
+    if isinstance(node, Operation):
+        this, other = children
+        folded = _fold(node, this, other, uses)
+        if folded is not None:
+            return folded
+        if this is node.this and other is node.other:
+            return node
+        return Operation(node.function, this, other)
+    if isinstance(node, Value) and isinstance(node.value, Resolveable):
+        (inner,) = children
+        if inner is node.value:
+            return node
+        if isinstance(inner, (Operation, Reduction, Elementwise)):
+            return Value(inner, constant=node.constant, name=node.name)
+        return _rename(inner, node.name)
+    if isinstance(node, Mixture):
+        if all(child is value for child, value in zip(children, node.values)):
+            return node
+        return Mixture(children, name=node.name, weights=node.weights)
+    if isinstance(node, Reduction):
+        reduced = _reduce(node, children, uses)
+        if reduced is not None:
+            return reduced
+        if all(child is value for child, value in zip(children, node.values)):
+            return node
+        return type(node)(children)
+    if isinstance(node, Elementwise):
+        if all(child is value for child, value in zip(children, node.values)):
+            return node
+        return Elementwise(node.function, *children)
+    if isinstance(node, Distribution) and node.parameters:
+        replacements = {
+            id(parameter): child for parameter, child in zip(node.parameters, children)
+        }
+        if all(child is parameter for child, parameter in zip(children, node.parameters)):
+            return node
+        args = [replacements.get(id(arg), arg) for arg in node.args]
+        kwargs = {key: replacements.get(id(value), value) for key, value in node.kwargs.items()}
+        return Distribution(node.function, *args, name=node.name, **kwargs)
+    return node
+
+
+def simplify(tree: BaseValue) -> BaseValue:
+    """Fold constants and replace subtrees that have closed forms with single distributions
+
+    Sums and differences of normals, products and quotients of lognormals, and affine maps of
+    normals, uniforms, and lognormals become single distributions, so fewer leaves are sampled.
+    Within longer sums and products, the terms that combine are folded and the others kept.
+    Only unnamed distributions that are used in a single place are combined, because otherwise
+    they aren't independent of the rest of the tree. Named values and distributions are kept, so
+    the representation of the tree still shows them.
+    """
+    uses = _uses(tree)
+    rewritten: Dict[int, Any] = {}
+    stack: List[Tuple[Resolveable, bool]] = [(tree, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if id(node) in rewritten:
+            continue
+        children = _children(node)
+        if children and not expanded:
+            stack.append((node, True))
+            stack.extend((child, False) for child in children)
+            continue
+        rewritten[id(node)] = _rewrite(node, [rewritten[id(child)] for child in children], uses)
+    return rewritten[id(tree)]
@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+from typing import Iterable, Optional, Sequence, Union
+
+import numpy as np
+
+
+class Moments:
+    """Online count, mean, variance, and range that can be merged across shards"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared deviations from the mean
+        self.min = np.inf
+        self.max = -np.inf
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}(count={self.count}, mean={self.mean}, std={self.std}, "
+            f"min={self.min}, max={self.max})"
+        )
+
+    @property
+    def variance(self) -> float:
+        if self.count < 2:
+            return np.nan
+        return self.m2 / (self.count - 1)
+
+    @property
+    def std(self) -> float:
+        return np.sqrt(self.variance)
+
+    def update(self, samples: Iterable[float]) -> Moments:
+        samples = np.asarray(samples).ravel()
+        if not samples.size:
+            return self
+        batch = type(self)()
+        batch.count = samples.size
+        batch.mean = float(samples.mean())
+        batch.m2 = float(((samples - batch.mean) ** 2).sum())
+        batch.min = float(samples.min())
+        batch.max = float(samples.max())
+        return self.merge(batch)
+
+    def merge(self, other: Moments) -> Moments:
+        # Chan et al.'s pairwise update
+        count = self.count + other.count
+        if not other.count:
+            return self
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+
+class TDigest:
+    """Mergeable quantile sketch
+
+    Centroids are merged in one vectorized pass by bucketing their cumulative weight on the
+    arcsine scale function, which keeps clusters small in the tails and large in the middle.
+    """
+
+    def __init__(self, compression: float = 200):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}(compression={self.compression}, centroids={self.means.size})"
+        )
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        cumulative = np.cumsum(weights)
+        quantiles = (cumulative - weights / 2) / cumulative[-1]
+        buckets = np.floor(self.compression / (2 * np.pi) * np.arcsin(2 * quantiles - 1))
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(buckets)) + 1])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def update(self, samples: Iterable[float]) -> TDigest:
+        samples = np.asarray(samples, dtype=float).ravel()
+        if not samples.size:
+            return self
+        self.min = min(self.min, samples.min())
+        self.max = max(self.max, samples.max())
+        self._compress(
+            np.concatenate([self.means, samples]),
+            np.concatenate([self.weights, np.ones(samples.size)]),
+        )
+        return self
+
+    def merge(self, other: TDigest) -> TDigest:
+        if not other.weights.size:
+            return self
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(
+            np.concatenate([self.means, other.means]),
+            np.concatenate([self.weights, other.weights]),
+        )
+        return self
+
+    def _positions(self) -> np.ndarray:
+        cumulative = np.cumsum(self.weights)
+        return np.concatenate([[0], (cumulative - self.weights / 2) / cumulative[-1], [1]])
+
+    def quantile(
+        self, quantiles: Union[float, Sequence[float], np.ndarray]
+    ) -> Union[float, np.ndarray]:
+        means = np.concatenate([[self.min], self.means, [self.max]])
+        return np.interp(quantiles, self._positions(), means)
+
+    def cdf(self, values: Union[float, Sequence[float], np.ndarray]) -> Union[float, np.ndarray]:
+        means = np.concatenate([[self.min], self.means, [self.max]])
+        return np.interp(values, means, self._positions())
+
+
+class Histogram:
+    """Fixed-bin histogram that counts samples outside its range separately"""
+
+    def __init__(self, low: float, high: float, bins: int = 100):
+        self.edges = np.linspace(low, high, bins + 1)
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.edges[0]}, {self.edges[-1]}, bins={self.counts.size})"
+
+    def update(self, samples: Iterable[float]) -> Histogram:
+        samples = np.asarray(samples).ravel()
+        self.counts += np.histogram(samples, self.edges)[0]
+        self.underflow += int((samples < self.edges[0]).sum())
+        self.overflow += int((samples > self.edges[-1]).sum())
+        return self
+
+    def merge(self, other: Histogram) -> Histogram:
+        assert np.array_equal(self.edges, other.edges), "Histograms must have the same bins"
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+
+class SampleSketch:
+    """Fixed-size summary of samples that answers queries and draws new samples
+
+    Keeps the quantiles of the samples at `size` evenly spaced probabilities from 0 to 1, so the
+    minimum and the maximum are kept exactly, and their exact count and mean. Quantiles and the
+    CDF interpolate linearly between the kept quantiles, and the PDF is that of the resulting
+    piecewise uniform distribution. Sketches are immutable, hashable, and compare by content, so
+    they can parametrize distributions through `dsl.from_sketch`.
+    """
+
+    def __init__(self, points: Iterable[float], count: int, mean: float):
+        self.points = np.array(points, dtype=float)
+        if self.points.ndim != 1 or self.points.size < 2:
+            raise ValueError("Sketches need at least two points")
+        if np.any(np.diff(self.points) < 0):
+            raise ValueError("Sketch points must be sorted")
+        self.points.flags.writeable = False
+        self.probabilities = np.linspace(0, 1, self.points.size)
+        self.count = count
+        self.mean = mean
+        self.hash = hash((self.points.tobytes(), count, mean))
+
+    def __repr__(self):
+        return f"{type(self).__name__}(count={self.count}, mean={self.mean}, size={self.size})"
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, SampleSketch)
+            and self.hash == other.hash
+            and (self.count, self.mean) == (other.count, other.mean)
+            and np.array_equal(self.points, other.points)
+        )
+
+    def __hash__(self):
+        return self.hash
+
+    def __reduce__(self):
+        return (type(self), (self.points, self.count, self.mean))
+
+    @property
+    def size(self) -> int:
+        return self.points.size
+
+    @property
+    def nbytes(self) -> int:
+        return self.points.nbytes
+
+    @classmethod
+    def from_samples(cls, samples: Iterable[float], size: int = 1000) -> SampleSketch:
+        samples = np.asarray(samples, dtype=float).ravel()
+        return cls(np.quantile(samples, np.linspace(0, 1, size)), samples.size, samples.mean())
+
+    @classmethod
+    def from_stream(
+        cls, chunks: Iterable[Iterable[float]], size: int = 1000, compression: float = 1000
+    ) -> SampleSketch:
+        """Sketch chunks of samples, e.g., from `resolution.stream`, in bounded memory"""
+        digest, moments = TDigest(compression), Moments()
+        for chunk in chunks:
+            digest.update(chunk)
+            moments.update(chunk)
+        points = np.asarray(digest.quantile(np.linspace(0, 1, size)))
+        return cls(points, moments.count, moments.mean)
+
+    def quantile(
+        self, quantiles: Union[float, Sequence[float], np.ndarray]
+    ) -> Union[float, np.ndarray]:
+        return np.interp(quantiles, self.probabilities, self.points)
+
+    def cdf(self, values: Union[float, Iterable[float]]) -> Union[float, np.ndarray]:
+        # The right end of runs of equal points, so that atoms count fully
+        values = np.asarray(values, dtype=float)
+        ranks = np.searchsorted(self.points, values, side="right")
+        below = np.clip(ranks - 1, 0, self.size - 2)
+        low, high = self.points[below], self.points[below + 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fraction = np.clip(np.where(high > low, (values - low) / (high - low), 1.0), 0, 1)
+        cdf = (below + fraction) / (self.size - 1)
+        cdf = np.where(values < self.points[0], 0.0, np.where(values >= self.points[-1], 1.0, cdf))
+        return cdf if cdf.ndim else float(cdf)
+
+    def pdf(self, values: Union[float, Iterable[float]]) -> Union[float, np.ndarray]:
+        values = np.asarray(values, dtype=float)
+        ranks = np.searchsorted(self.points, values, side="right")
+        below = np.clip(ranks - 1, 0, self.size - 2)
+        widths = self.points[below + 1] - self.points[below]
+        with np.errstate(divide="ignore"):
+            pdf = 1 / ((self.size - 1) * widths)
+        pdf = np.where((values < self.points[0]) | (values > self.points[-1]), 0.0, pdf)
+        return pdf if pdf.ndim else float(pdf)
+
+    def sample(
+        self, size: Optional[int] = None, generator: Optional[np.random.Generator] = None
+    ) -> Union[float, np.ndarray]:
+        """Draw samples by inverse CDF"""
+        generator = generator or np.random.default_rng()
+        return self.quantile(generator.random(size))
+
+
+def sketched(uniforms: np.ndarray, sketch: SampleSketch) -> np.ndarray:
+    """Map uniforms onto the distribution of a sketch, i.e., its inverse CDF"""
+    return np.asarray(sketch.quantile(uniforms))
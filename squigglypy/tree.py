@@ -1,18 +1,32 @@
 from __future__ import annotations
 
 import operator
+import struct
+from concurrent.futures import CancelledError
 from copy import copy
 from itertools import chain
 from collections.abc import Callable
-from dataclasses import replace
-from functools import partialmethod
-from random import sample
-from typing import Any, Hashable, Iterable, List, Optional, Sequence, Tuple, Union
+from functools import partial, partialmethod, reduce
+from typing import (
+    Any,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 from enum import Enum
 
 import numpy as np
+from scipy.special import ndtri  # type: ignore
 
-from .context import CacheKey, Context
+from .context import CacheKey, Context, Memo, NodeKey, SwungdashContext, split_sample_count
+from .stats import SampleSketch, sketched
 
 
 class Empty(Enum):
@@ -23,16 +37,87 @@ class Empty(Enum):
 _empty = Empty.empty
 
 
+def _weak(value: Any) -> Any:
+    """Turn NumPy scalars into Python scalars, which never widen the samples they combine with"""
+    if isinstance(value, np.floating):
+        return value.item()
+    return value
+
+
+def _cast(value: Any, dtype: np.dtype) -> Any:
+    """Store floating samples in the dtype of the context
+
+    Integer and boolean samples keep their type, and operations that mix them with floating
+    samples produce floating samples, which are cast in turn.
+    """
+    if isinstance(value, np.ndarray) and value.dtype.kind == "f" and value.dtype != dtype:
+        return value.astype(dtype)
+    return value
+
+
 class Resolveable:
+    digest: NodeKey
+
     def __invert__(self):
-        return self._resolve()
+        context = Context.getcontext()
+        if context.cancelled is not None and context.cancelled.is_set():
+            raise CancelledError(f"Resolution of {self} was cancelled")
+        if context.memo is None and _children(self):
+            token = Context.context.set(context.replace(memo=Memo(_reached_twice(self))))
+            try:
+                return ~self
+            finally:
+                Context.context.reset(token)
+        if context.profiler is None:
+            return self._resolve()
+        return context.profiler.measure(self, self._resolve)
 
     def _resolve(self) -> Union[Any, Iterable[Any], Empty]:
         raise NotImplementedError
 
     @property
     def cache_key(self) -> Hashable:
-        raise NotImplementedError
+        return self._cache_key(Context.getcontext())
+
+    def _cache_key(self, context: SwungdashContext) -> Hashable:
+        return CacheKey(self.digest, context.sample_count, context.dtype, context.sampling)
+
+    def _cacheable(self, context: SwungdashContext) -> bool:
+        return context.cache_rule != "never" and not (
+            context.cache_rule == "constant" and self.digest.volatile
+        )
+
+    def _shared(self, context: SwungdashContext) -> bool:
+        """Return whether the resolution reaches this node more than once"""
+        return context.memo is not None and self.digest in context.memo.shared
+
+    def _memoize(
+        self,
+        context: SwungdashContext,
+        compute: Callable[[SwungdashContext], Any],
+        persist: bool = True,
+    ):
+        """Look up or compute a result, and keep it in the cache and, if shared, in the memo
+
+        Without `persist`, the result is only looked up in and kept in the memo.
+        """
+        shared = self._shared(context)
+        cacheable = persist and self._cacheable(context)
+        if not shared and not cacheable:
+            return compute(context)
+        cache_key = self._cache_key(context)
+        value = context.memo.results.get(cache_key, _empty) if shared else _empty  # type: ignore
+        if value is _empty and cacheable:
+            value = context.cache.get(cache_key, _empty)
+        if context.profiler is not None:
+            context.profiler.count(self, cache_key, hit=value is not _empty)
+        if value is _empty:
+            value = compute(context)
+            if cacheable:
+                context.cache[cache_key] = value
+        if shared:
+            context.memo.results[cache_key] = value  # type: ignore
+        return value
 
 
 class BaseValue(Resolveable):
@@ -50,8 +135,22 @@ class BaseValue(Resolveable):
         if reverse:
             assert other.value is not _empty
             return Value(Operation(function, other, self))
+        # Flatten chains like `a + b + c + ...` into a single reduction, but keep named values
+        reduction = REDUCTIONS.get(function)
+        if reduction is not None and isinstance(self, Value) and self.name is None:
+            if isinstance(self.value, reduction):
+                return Value(self.value._extend(other))
+            if isinstance(self.value, Operation) and self.value.function is function:
+                return Value(reduction([self.value.this, self.value.other, other]))
         return Value(Operation(function, self, other))
 
+    def __bool__(self):
+        if self.digest.volatile:
+            raise TypeError(
+                f"The truth value of {self}, which depends on a variable, is ambiguous"
+            )
+        return True
+
     __neg__ = partialmethod(_operation, operator.neg)
     __pos__ = partialmethod(_operation, operator.pos)
     __abs__ = partialmethod(_operation, operator.abs)
@@ -81,6 +180,13 @@ class BaseValue(Resolveable):
     __gt__ = partialmethod(_operation, operator.gt)
 
 
+def _identity(value: Any) -> Any:
+    """Return what identifies a constant, which for floats is their bits, as -0.0 == 0.0"""
+    if isinstance(value, (float, np.floating)):
+        return struct.pack("d", value)
+    return value
+
+
 class Value(BaseValue):
     def __init__(
         self,
@@ -91,17 +197,26 @@ class Value(BaseValue):
         self.value = value
         self.constant = constant
         self.name = name
+        if isinstance(value, Resolveable):
+            self.digest = value.digest
+        elif constant is False:
+            # Values that depend on independent variables, i.e., tracers, change after the fact
+            self.digest = NodeKey.unique(Value, volatile=True)
+        else:
+            self.digest = NodeKey.intern(Value, type(value), _identity(value))
 
     def __repr__(self):
         if self.name:
             return self.name
         return str(self.value)
 
-    @property
-    def cache_key(self):
+    def __copy__(self):
+        return type(self)(self.value, constant=self.constant, name=self.name)
+
+    def _cache_key(self, context: SwungdashContext):
         if isinstance(self.value, Resolveable):
-            return self.value.cache_key
-        return self.value
+            return self.value._cache_key(context)  # pylint: disable=protected-access
+        return CacheKey(self.digest)
 
     def _resolve(self):
         if isinstance(self.value, Resolveable):
@@ -146,6 +261,24 @@ class Operation(Resolveable):
         operator.pow: 14,
         operator.abs: 16,
     }
+    UFUNCS = {
+        operator.neg: np.negative,
+        operator.pos: np.positive,
+        operator.abs: np.absolute,
+        operator.add: np.add,
+        operator.floordiv: np.floor_divide,
+        operator.mod: np.remainder,
+        operator.mul: np.multiply,
+        operator.pow: np.power,
+        operator.sub: np.subtract,
+        operator.truediv: np.true_divide,
+        operator.lt: np.less,
+        operator.le: np.less_equal,
+        operator.eq: np.equal,
+        operator.ne: np.not_equal,
+        operator.ge: np.greater_equal,
+        operator.gt: np.greater,
+    }
 
     format: Optional[Callable[..., str]] = None
     precedence: int = -1
@@ -163,54 +296,229 @@ class Operation(Resolveable):
             self.format = self.FORMATS[function].format
         if function in self.PRECEDENCE:
             self.precedence = self.PRECEDENCE[function]
-
-    @property
-    def cache_key(self):
-        this_key = self.this.cache_key
-        other_key = self.other.cache_key
-        return CacheKey(function=self.function, nested=(this_key, other_key))
+        self.digest = NodeKey.intern(Operation, function, this.digest, other.digest)
 
     def __repr__(self):
         if self.format:
             if self.other is _empty:
                 return self.format(this=self.this)
             this, other = str(self.this), str(self.other)
-            if (
-                isinstance(self.this, Value)
-                and isinstance(self.this.value, Operation)
-                and self.this.value.precedence < self.precedence
-            ):
+            if _precedence(self.this) < self.precedence:
                 this = f"({this})"
-            if (
-                isinstance(self.other, Value)
-                and isinstance(self.other.value, Operation)
-                and self.other.value.precedence <= self.precedence
-            ):
+            if _precedence(self.other) <= self.precedence:
                 other = f"({other})"
             return self.format(this=this, other=other)
         return f"{type(self).__name__}({self.function.__name__}, {self.this}, {self.other})"
 
+    def _compute(self, context: SwungdashContext):
+        # Resolve through a plan rather than recursively, so that deep trees don't exhaust the stack
+        return compile(self)._execute(context, memoize=True)
+
+    def _resolve(self):
+        return self._memoize(Context.getcontext(), self._compute)
+
+
+class Reduction(Resolveable):
+    """An associative and commutative operation on any number of values
+
+    Plans accumulate reductions in place into a single buffer rather than allocating a temporary
+    for every pair of values. Extending a reduction by one value shares the list of values with
+    it, so that building a reduction of n values term by term takes linear time.
+    """
+
+    function: Callable[..., Any]
+    ufunc: np.ufunc
+    separator: str
+    precedence: int
+
+    def __init__(self, values: Sequence[BaseValue], digest: Optional[NodeKey] = None):
+        if len(values) < 2:
+            raise ValueError(f"{type(self).__name__} needs at least two values")
+        self._values = values if isinstance(values, list) else list(values)
+        self.count = len(values)
+        if digest is None:
+            digest = NodeKey.intern(type(self), values[0].digest, values[1].digest)
+            for value in values[2:]:
+                digest = NodeKey.intern(type(self), digest, value.digest)
+        self.digest = digest
+
+    @property
+    def values(self) -> List[BaseValue]:
+        return self._values[: self.count]
+
+    def __repr__(self):
+        values = self.values
+        terms = [str(values[0]) if _precedence(values[0]) >= self.precedence else f"({values[0]})"]
+        terms.extend(
+            str(value) if _precedence(value) > self.precedence else f"({value})"
+            for value in values[1:]
+        )
+        return self.separator.join(terms)
+
+    def _extend(self, value: BaseValue) -> Reduction:
+        if len(self._values) == self.count:  # Nobody extended this reduction yet
+            self._values.append(value)
+            values = self._values
+        else:
+            values = self.values + [value]
+        return type(self)(values, digest=NodeKey.intern(type(self), self.digest, value.digest))
+
+    def _combine(self, *values: Any) -> Any:
+        return reduce(self.function, values)
+
+    def _compute(self, context: SwungdashContext):
+        return compile(self)._execute(context, memoize=True)
+
+    def _resolve(self):
+        return self._memoize(Context.getcontext(), self._compute)
+
+
+class Sum(Reduction):
+    function = operator.add
+    ufunc = np.add
+    separator = " + "
+    precedence = Operation.PRECEDENCE[operator.add]
+
+
+class Product(Reduction):
+    function = operator.mul
+    ufunc = np.multiply
+    separator = " * "
+    precedence = Operation.PRECEDENCE[operator.mul]
+
+
+REDUCTIONS = {operator.add: Sum, operator.mul: Product}
+
+
+class Elementwise(Resolveable):
+    """A NumPy function, like `np.exp` or `np.where`, applied elementwise to any number of values"""
+
+    def __init__(self, function: Callable[..., Any], *values: BaseValue):
+        self.function = function
+        self.values = values
+        self.digest = NodeKey.intern(Elementwise, function, *(value.digest for value in values))
+
+    def __repr__(self):
+        return f"{self.function.__name__}({', '.join(map(str, self.values))})"
+
+    def _compute(self, context: SwungdashContext):
+        return compile(self)._execute(context, memoize=True)
+
     def _resolve(self):
-        this, other = ~self.this, ~self.other
-        if other is _empty:
-            return self.function(this)
-        return self.function(this, other)
+        return self._memoize(Context.getcontext(), self._compute)
+
+
+def _precedence(value: Resolveable) -> float:
+    """Return the precedence of the operation a value wraps, which is that of an atom otherwise"""
+    if isinstance(value, Value) and isinstance(value.value, (Operation, Reduction)):
+        return value.value.precedence
+    return float("inf")
+
+
+def _key(parameter: Any) -> Any:
+    """Return what identifies a parameter of a distribution, i.e., the digest of a value"""
+    if isinstance(parameter, Resolveable):
+        return parameter.digest
+    return parameter
+
+
+def _normal(
+    generator: np.random.Generator,
+    loc: float = 0.0,
+    scale: float = 1.0,
+    size: Optional[int] = None,
+    dtype: Any = np.float64,
+) -> np.ndarray:
+    samples = generator.standard_normal(size, dtype=dtype)
+    samples *= scale
+    samples += loc
+    return samples
+
+
+def _uniform(
+    generator: np.random.Generator,
+    low: float = 0.0,
+    high: float = 1.0,
+    size: Optional[int] = None,
+    dtype: Any = np.float64,
+) -> np.ndarray:
+    samples = generator.random(size, dtype=dtype)
+    samples *= high - low
+    samples += low
+    return samples
+
+
+def _lognormal(
+    generator: np.random.Generator,
+    mean: float = 0.0,
+    sigma: float = 1.0,
+    size: Optional[int] = None,
+    dtype: Any = np.float64,
+) -> np.ndarray:
+    samples = _normal(generator, mean, sigma, size=size, dtype=dtype)
+    return np.exp(samples, out=samples)
+
+
+def _pareto(
+    generator: np.random.Generator, a: float, size: Optional[int] = None, dtype: Any = np.float64
+) -> np.ndarray:
+    samples = generator.standard_exponential(size, dtype=dtype)
+    samples /= a
+    return np.expm1(samples, out=samples)
+
+
+def _pareto_quantile(uniforms: np.ndarray, a: float) -> np.ndarray:
+    return (1 - uniforms) ** (-1 / a) - 1  # Of the Lomax distribution, like `Generator.pareto`
 
 
 class Distribution(BaseValue):
-    constant = True
+    constant: Optional[bool] = True
+    # Inverse CDFs to map the uniforms of designs onto distributions
+    QUANTILES: Dict[Callable[..., Any], Callable[..., Any]] = {
+        np.random.Generator.normal: lambda uniforms, loc=0.0, scale=1.0: (
+            loc + scale * ndtri(uniforms)
+        ),
+        np.random.Generator.uniform: lambda uniforms, low=0.0, high=1.0: (
+            low + (high - low) * uniforms
+        ),
+        np.random.Generator.lognormal: lambda uniforms, mean=0.0, sigma=1.0: np.exp(
+            mean + sigma * ndtri(uniforms)
+        ),
+        np.random.Generator.pareto: _pareto_quantile,
+        sketched: sketched,
+    }
+    # Samplers for float32, built on the `Generator` methods that accept a `dtype`
+    SAMPLERS: Dict[Callable[..., Any], Callable[..., np.ndarray]] = {
+        np.random.Generator.normal: _normal,
+        np.random.Generator.uniform: _uniform,
+        np.random.Generator.lognormal: _lognormal,
+        np.random.Generator.pareto: _pareto,
+    }
 
     def __init__(
         self,
         function: Callable[..., Iterable[float]],
-        *args: float,
+        *args: Union[float, BaseValue, SampleSketch],
         name: Optional[str] = None,
-        **kwargs: Empty,
+        **kwargs: Union[float, BaseValue, SampleSketch],
     ):  # pylint: disable=super-init-not-called
         self.function = function
         self.name = name
         self.args = args
         self.kwargs = kwargs
+        # Parameters that are values themselves, which are resolved and broadcast per sample
+        self.parameters = [
+            arg for arg in chain(args, kwargs.values()) if isinstance(arg, Resolveable)
+        ]
+        if self.parameters:
+            self.constant = None  # Depends on the parameters
+            args = tuple(_key(arg) for arg in args)
+            kwargs = {key: _key(value) for key, value in kwargs.items()}
+        self.digest = NodeKey.intern(Distribution, function, args, tuple(sorted(kwargs.items())))
+        # Unbound `Generator` methods draw from the stream of the context
+        self.generator_method = function is getattr(
+            np.random.Generator, getattr(function, "__name__", ""), None
+        )
 
     def __repr__(self):
         if self.name:
@@ -220,64 +528,471 @@ class Distribution(BaseValue):
         kwargs = ", ".join(f"{key}={value}" for key, value in self.kwargs.items())
         return f'{name}({", ".join(part for part in (args, kwargs) if part)})'
 
-    @property
-    def cache_key(self):
-        with Context() as context:
-            return CacheKey(
-                sample_count=context.sample_count,
-                function=self.function,
-                args=self.args,
-                kwargs=tuple(sorted(self.kwargs.items())),
-            )
+    def _sample(self, context: SwungdashContext):
+        return self._draw(context, [~parameter for parameter in self.parameters])
+
+    def _draw(self, context: SwungdashContext, parameters: Sequence[Any]):
+        """Draw samples given the resolutions of the parameters that are values"""
+        args, kwargs = self.args, self.kwargs
+        if parameters:
+            # NumPy broadcasts arrays of parameters, so every sample is drawn with its own ones
+            resolved = iter(map(_weak, parameters))
+            args = tuple(next(resolved) if isinstance(arg, Resolveable) else arg for arg in args)
+            kwargs = {
+                key: next(resolved) if isinstance(value, Resolveable) else value
+                for key, value in kwargs.items()
+            }
+        if self.function in self.QUANTILES and (
+            context.design is not None or not self.generator_method
+        ):
+            # Inverse CDFs that aren't `Generator` methods map the uniforms of the stream
+            if context.design is not None:
+                uniforms = context.design.uniforms(self.digest, context.sample_count)
+            else:
+                uniforms = context.generator.random(context.sample_count)
+            samples = self.QUANTILES[self.function](uniforms, *args, **kwargs)
+            return _cast(samples, context.dtype)
+        if self.generator_method:
+            if context.dtype == np.float32 and self.function in self.SAMPLERS:
+                return self.SAMPLERS[self.function](
+                    context.generator,
+                    *args,
+                    size=context.sample_count,
+                    dtype=context.dtype,
+                    **kwargs,
+                )
+            samples = self.function(context.generator, *args, size=context.sample_count, **kwargs)
+        else:
+            samples = self.function(*args, size=context.sample_count, **kwargs)
+        return _cast(samples, context.dtype)
 
     def _resolve(self):
-        with Context() as context:
-            if self.cache_key in context.cache:
-                return context.cache[self.cache_key]
-            value = self.function(*self.args, size=context.sample_count, **self.kwargs)
-            context.cache[self.cache_key] = value
-            return value
+        return self._memoize(Context.getcontext(), self._sample)
 
 
 class Mixture(BaseValue):
     def __init__(
-        self, values: Sequence[BaseValue], name: Optional[str] = None
+        self,
+        values: Sequence[BaseValue],
+        name: Optional[str] = None,
+        weights: Optional[Sequence[float]] = None,
     ):  # pylint: disable=super-init-not-called
         self.values = values
         self.name = name
+        self.weights: Optional[Tuple[float, ...]] = None
+        if weights is not None:
+            if len(weights) != len(values) or min(weights) < 0 or not sum(weights) > 0:
+                raise ValueError("Weights must be one non-negative number per value")
+            self.weights = tuple(float(weight) / sum(weights) for weight in weights)
+        self.digest = NodeKey.intern(Mixture, *(value.digest for value in values), self.weights)
 
     def __repr__(self):
         if self.name:
             return self.name
+        if self.weights is not None:
+            return f"{type(self).__name__}({self.values}, weights={list(self.weights)})"
         return f"{type(self).__name__}({self.values})"
 
-    @property
-    def cache_key(self):
-        with Context() as context:
-            return CacheKey(
-                sample_count=context.sample_count,
-                nested=tuple(replace(value.cache_key, sample_count=None) for value in self.values),
-            )
+    def _allocate(self, context: SwungdashContext) -> Tuple[List[int], np.ndarray]:
+        """Return the sample count of each component and the output positions of all samples"""
+        if self.weights is None:
+            sample_counts = split_sample_count(context.sample_count, len(self.values))
+            sample_counts = context.generator.permutation(sample_counts).tolist()  # Shuffling
+        else:
+            sample_counts = context.generator.multinomial(
+                context.sample_count, self.weights
+            ).tolist()
+        # Interleave the components, so that samples don't correlate with their position
+        return sample_counts, context.generator.permutation(context.sample_count)
 
     @staticmethod
-    def _sample(*values: BaseValue):
-        with Context() as context:
-            remainder = context.sample_count % len(values)
-            sample_counts = [context.sample_count // len(values)] * len(values)
-        sample_counts = [
-            sample_count + int(i < remainder) for i, sample_count in enumerate(sample_counts)
-        ]
-        sample_counts = sample(sample_counts, len(sample_counts))  # Shuffling
-        samples = []
-        for value, sample_count in zip(values, sample_counts):
+    def _scatter(
+        samples: Sequence[Any],
+        sample_counts: Sequence[int],
+        order: np.ndarray,
+        dtype: Optional[np.dtype] = None,
+    ):
+        drawn = [sample for sample, sample_count in zip(samples, sample_counts) if sample_count]
+        # Nothing is drawn for no samples, whose type is then that of the samples of the context
+        result_type = np.result_type(*drawn) if drawn else np.dtype(dtype or np.float64)
+        if dtype is not None and result_type.kind == "f":
+            result_type = dtype
+        output = np.empty(order.size, dtype=result_type)
+        start = 0
+        for sample, sample_count in zip(samples, sample_counts):
+            output[order[start : start + sample_count]] = sample
+            start += sample_count
+        return output
+
+    def _sample(self, context: SwungdashContext):
+        sample_counts, order = self._allocate(context)
+        samples: List[Any] = []
+        for value, sample_count in zip(self.values, sample_counts):
+            if not sample_count:
+                samples.append(None)
+                continue
             with Context(sample_count=sample_count):
                 samples.append(~value)
-        return np.concatenate(samples)
+        return self._scatter(samples, sample_counts, order, context.dtype)
+
+    def _resolve(self):
+        return self._memoize(Context.getcontext(), self._sample)
+
+
+class Instruction(NamedTuple):
+    node: Resolveable
+    function: Optional[Callable[..., Any]] = None  # Unset for loads, which resolve the node
+    ufunc: Optional[np.ufunc] = None
+    operands: Tuple[int, ...] = ()
+    release: Tuple[int, ...] = ()  # Slots whose last use is this instruction
+    partial: bool = False  # A step of a reduction before the last, which results in a `_Total`
+
+
+class _Total(NamedTuple):
+    """The running total of a reduction, with booleans totalled as integers"""
+
+    buffer: np.ndarray
+    dtype: np.dtype  # That of the total, which is only boolean if all its terms are
+
+
+_SCALARS = (int, float, complex, np.generic)
+
+
+class Plan(Resolveable):
+    def __init__(self, tree: Resolveable, instructions: Sequence[Instruction]):
+        self.tree = tree
+        self.instructions = instructions
+        self.digest = tree.digest
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.tree})"
+
+    @property
+    def width(self) -> int:
+        """Return the maximum number of results that are alive at the same time"""
+        live = width = 0
+        for instruction in self.instructions:
+            live += 1
+            width = max(width, live)
+            live -= len(instruction.release)
+        return width
+
+    @staticmethod
+    def _apply(
+        instruction: Instruction,
+        registers: List[Any],
+        owned: List[bool],
+        pool: Dict[Tuple[Any, ...], List[np.ndarray]],
+        sample_dtype: np.dtype,
+    ) -> Tuple[Any, bool]:
+        assert instruction.function
+        if isinstance(instruction.node, Reduction) and len(instruction.operands) == 2:
+            return Plan._step(instruction, registers, owned, pool, sample_dtype)
+        args = [_weak(registers[slot]) for slot in instruction.operands]
+        ufunc = instruction.ufunc
+        if (
+            ufunc is None
+            or not all(isinstance(arg, (np.ndarray, *_SCALARS)) for arg in args)
+            or not any(isinstance(arg, np.ndarray) for arg in args)
+        ):
+            return _cast(instruction.function(*args), sample_dtype), False
+        # Zero-length probe to learn the result type without computing anything
+        probes = [np.empty(0, arg.dtype) if isinstance(arg, np.ndarray) else arg for arg in args]
+        dtype = (ufunc(*probes) if len(probes) <= 2 else reduce(ufunc, probes)).dtype
+        if dtype.kind == "f":
+            dtype = sample_dtype
+        if len(args) > 2:
+            return Plan._accumulate(instruction, args, registers, owned, pool, dtype), True
+        shape = np.broadcast(*args).shape
+        for slot in instruction.release:
+            buffer = registers[slot]
+            if owned[slot] and buffer.shape == shape and buffer.dtype == dtype:
+                owned[slot] = False  # Handed over to the result, so don't recycle it
+                return ufunc(*args, out=buffer), True
+        buffers = pool.get((shape, dtype))
+        if buffers:
+            return ufunc(*args, out=buffers.pop()), True
+        return ufunc(*args, out=np.empty(shape, dtype)), True
+
+    @staticmethod
+    def _accumulate(
+        instruction: Instruction,
+        args: List[Any],
+        registers: List[Any],
+        owned: List[bool],
+        pool: Dict[Tuple[Any, ...], List[np.ndarray]],
+        dtype: np.dtype,
+    ) -> np.ndarray:
+        """Reduce the arguments of a reduction in place into a single buffer
+
+        The arguments are reduced from left to right in the result type, whichever buffer is
+        reused, because reductions of mixed types aren't associative, e.g., booleans add as `or`.
+        """
+        ufunc = instruction.ufunc
+        assert ufunc
+        shape: Tuple[int, ...] = ()
+        for arg in args:  # Rather than at once, which NumPy limits to 32 arguments
+            if np.shape(arg) != shape:
+                shape = np.broadcast(np.broadcast_to(False, shape), arg).shape
+        first = instruction.operands[0]
+        buffer = registers[first]
+        if (
+            first in instruction.release
+            and owned[first]
+            and buffer.shape == shape
+            and buffer.dtype == dtype
+            and instruction.operands.count(first) == 1  # Lest it change before it's read
+        ):
+            owned[first] = False
+        else:
+            buffers = pool.get((shape, dtype))
+            buffer = buffers.pop() if buffers else np.empty(shape, dtype)
+            buffer[...] = args[0]
+        for arg in args[1:]:
+            ufunc(buffer, arg, out=buffer)
+        return buffer
+
+    @staticmethod
+    def _step(
+        instruction: Instruction,
+        registers: List[Any],
+        owned: List[bool],
+        pool: Dict[Tuple[Any, ...], List[np.ndarray]],
+        sample_dtype: np.dtype,
+    ) -> Tuple[Any, bool]:
+        """Add a term to the running total of a reduction, in place where the total allows
+
+        Booleans are totalled as integers, so that they add up as they would in the result type
+        of the whole reduction rather than combine with `or`, and only turn back into booleans
+        at the last step of a reduction whose terms are all booleans.
+        """
+        assert instruction.function and instruction.ufunc
+        first, second = instruction.operands
+        total, term = registers[first], _weak(registers[second])
+        if isinstance(total, _Total):
+            buffer, dtype = total
+            owned[first] = False  # The steps of a reduction hand its buffer on to each other
+            reusable = True
+        else:
+            buffer, dtype = _weak(total), None
+            reusable = first in instruction.release and owned[first] and first != second
+        if not all(isinstance(arg, (np.ndarray, *_SCALARS)) for arg in (buffer, term)) or not any(
+            isinstance(arg, np.ndarray) for arg in (buffer, term)
+        ):
+            if dtype is not None and dtype.kind == "b":
+                buffer = buffer.astype(bool)
+            return _cast(instruction.function(buffer, term), sample_dtype), False
+        # Zero-length probe to learn the result type without computing anything
+        probes = [
+            np.empty(0, arg.dtype) if isinstance(arg, np.ndarray) else arg
+            for arg in (buffer, term)
+        ]
+        if dtype is not None:
+            probes[0] = np.empty(0, dtype)
+        dtype = instruction.ufunc(*probes).dtype
+        if dtype.kind == "f":
+            dtype = sample_dtype
+        storage = np.dtype(np.int64) if dtype.kind == "b" else dtype
+        shape = np.broadcast(buffer, term).shape
+        if reusable and np.shape(buffer) == shape and buffer.dtype == storage:
+            owned[first] = False  # Handed over to the total, so don't recycle it
+        else:
+            if reusable:
+                pool.setdefault((buffer.shape, buffer.dtype), []).append(buffer)
+                owned[first] = False
+            buffers = pool.get((shape, storage))
+            result = buffers.pop() if buffers else np.empty(shape, storage)
+            result[...] = buffer
+            buffer = result
+        instruction.ufunc(buffer, term, out=buffer)
+        if instruction.partial:
+            return _Total(buffer, dtype), True
+        if storage != dtype:
+            pool.setdefault((buffer.shape, buffer.dtype), []).append(buffer)
+            return buffer.astype(dtype), True
+        return buffer, True
+
+    def _execute(self, context: SwungdashContext, memoize: bool = False):
+        """Run the instructions, and with `memoize`, cache the results of all but the last"""
+        registers: List[Any] = [None] * len(self.instructions)
+        owned = [False] * len(self.instructions)
+        pool: Dict[Tuple[Any, ...], List[np.ndarray]] = {}
+        last = len(self.instructions) - 1
+        for slot, instruction in enumerate(self.instructions):
+            if context.cancelled is not None and context.cancelled.is_set():
+                raise CancelledError(f"Resolution of {self} was cancelled")
+            if instruction.function is None:
+                registers[slot] = ~instruction.node
+            else:
+                compute = partial(self._apply, instruction, registers, owned, pool, context.dtype)
+                node = instruction.node
+                # Intermediate results are only cached under "always", lest the cache rather than
+                # the plan own their buffers, and otherwise only kept while the resolution needs them
+                persist = context.cache_rule == "always"
+                if (
+                    memoize
+                    and slot < last
+                    and not instruction.partial
+                    and ((persist and node._cacheable(context)) or node._shared(context))
+                ):
+                    compute = partial(_shared, node, context, compute, persist)
+                # The last result of a memoized plan is that of the node that runs it, and running
+                # totals are that of no node
+                if context.profiler is None or (memoize and slot == last) or instruction.partial:
+                    registers[slot], owned[slot] = compute()
+                else:
+                    registers[slot], owned[slot] = context.profiler.measure(
+                        instruction.node, compute, result=operator.itemgetter(0)
+                    )
+            for dead in instruction.release:
+                if owned[dead]:
+                    buffer = registers[dead]
+                    if isinstance(buffer, _Total):  # Of a reduction whose result was cached
+                        buffer = buffer.buffer
+                    pool.setdefault((buffer.shape, buffer.dtype), []).append(buffer)
+                registers[dead] = None
+        return registers[-1]
 
     def _resolve(self):
-        with Context() as context:
-            if self.cache_key in context.cache:
-                return context.cache[self.cache_key]
-            value = self._sample(*self.values)
-            context.cache[self.cache_key] = value
-            return value
\ No newline at end of file
+        return self._execute(Context.getcontext())
+
+
+def _shared(
+    node: Resolveable,
+    context: SwungdashContext,
+    compute: Callable[[], Tuple[Any, bool]],
+    persist: bool = True,
+) -> Tuple[Any, bool]:
+    """Look up or compute and memoize a result, which the memo or cache owns from then on"""
+    # pylint: disable=protected-access
+    return node._memoize(context, lambda _: compute()[0], persist), False
+
+
+def _children(node: Resolveable) -> List[Resolveable]:
+    if isinstance(node, Value):
+        return [node.value] if isinstance(node.value, Resolveable) else []
+    if isinstance(node, Operation):
+        if isinstance(node.other, Value) and node.other.value is _empty:
+            return [node.this]
+        return [node.this, node.other]
+    if isinstance(node, (Reduction, Elementwise, Mixture)):
+        return list(node.values)
+    if isinstance(node, Distribution):
+        return list(node.parameters)
+    if isinstance(node, Plan):
+        return [node.tree]
+    return []
+
+
+def _reached_twice(tree: Resolveable) -> Set[NodeKey]:
+    """Return the digests of the nodes that a resolution of a tree reaches more than once"""
+    reached: Set[NodeKey] = set()
+    shared: Set[NodeKey] = set()
+    expanded: Set[int] = set()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        for child in _children(node):
+            if child.digest is not node.digest:  # Values share the digests of what they wrap
+                if child.digest in reached:
+                    shared.add(child.digest)
+                reached.add(child.digest)
+            if id(child) not in expanded:
+                expanded.add(id(child))
+                stack.append(child)
+    return shared
+
+
+def _unwrap(node: Resolveable) -> Resolveable:
+    while isinstance(node, Value) and isinstance(node.value, Resolveable):
+        node = node.value
+    return node
+
+
+def _operands(operation: Union[Operation, Reduction, Elementwise]) -> List[Resolveable]:
+    if isinstance(operation, (Reduction, Elementwise)):
+        return [_unwrap(value) for value in operation.values]
+    if isinstance(operation.other, Value) and operation.other.value is _empty:
+        return [_unwrap(operation.this)]
+    return [_unwrap(operation.this), _unwrap(operation.other)]
+
+
+def _instruction(
+    node: Resolveable, operands: Tuple[int, ...] = (), release: Tuple[int, ...] = ()
+) -> Instruction:
+    """Return the instruction that computes a node from its operands, or that loads it"""
+    if isinstance(node, Operation):
+        function, ufunc = node.function, node.UFUNCS.get(node.function)
+    elif isinstance(node, Reduction):
+        function, ufunc = node._combine, node.ufunc  # pylint: disable=protected-access
+    elif isinstance(node, Elementwise):
+        function = node.function
+        ufunc = node.function if isinstance(node.function, np.ufunc) else None
+    else:
+        return Instruction(node=node)
+    return Instruction(node, function, ufunc, operands, release)
+
+
+def compile(tree: Resolveable) -> Plan:  # pylint: disable=redefined-builtin
+    """Lower a tree into a topologically ordered list of instructions
+
+    Structurally equal subtrees share a digest and are only computed once. Reductions add up their
+    terms one at a time, each right after it's computed, so that they don't all live at once.
+    """
+    nodes: List[Resolveable] = []
+    operands: List[Tuple[int, ...]] = []
+    partials: List[bool] = []
+    slots: Dict[NodeKey, int] = {}
+    # The slots of the running totals of the reductions being lowered, and their steps to go
+    totals: Dict[int, int] = {}
+    steps: Dict[int, int] = {}
+    stack: List[Tuple[Resolveable, Optional[List[Any]]]] = [(_unwrap(tree), None)]
+    while stack:
+        node, children = stack.pop()
+        if node.digest in slots:
+            continue
+        if isinstance(node, Reduction) and len(node.values) > 1:
+            if children is None:
+                # A step of `[term, term]` starts the total, and one of `[None, term]` adds to it
+                children = _operands(node)
+                for term in reversed(children[2:]):
+                    stack.extend([(node, [None, term]), (term, None)])
+                stack.extend([(node, children[:2]), (children[1], None), (children[0], None)])
+                steps[id(node)] = len(children) - 1
+                continue
+            previous, term = children
+            total = totals.pop(id(node)) if previous is None else slots[previous.digest]
+            operands.append((total, slots[term.digest]))
+            steps[id(node)] -= 1
+            partials.append(steps[id(node)] > 0)
+            if partials[-1]:
+                totals[id(node)] = len(nodes)
+                nodes.append(node)
+                continue
+            del steps[id(node)]
+        elif isinstance(node, (Operation, Reduction, Elementwise)):
+            if children is None:
+                children = _operands(node)
+                stack.append((node, children))
+                stack.extend((child, None) for child in reversed(children))
+                continue
+            operands.append(tuple(slots[child.digest] for child in children))
+            partials.append(False)
+        else:
+            operands.append(())
+            partials.append(False)
+        slots[node.digest] = len(nodes)
+        nodes.append(node)
+    # Liveness analysis: a result dies with the last instruction that reads it
+    last_uses: Dict[int, int] = {}
+    for index, operands_ in enumerate(operands):
+        for operand in operands_:
+            last_uses[operand] = index
+    releases: Dict[int, List[int]] = {}
+    for operand, index in last_uses.items():
+        releases.setdefault(index, []).append(operand)
+    instructions = [
+        _instruction(node, operands_, tuple(releases.get(index, ())))._replace(partial=partial_)
+        for index, (node, operands_, partial_) in enumerate(zip(nodes, operands, partials))
+    ]
+    return Plan(tree, instructions)
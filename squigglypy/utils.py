@@ -1,17 +1,22 @@
 from copy import copy
 from functools import wraps
-from itertools import chain
 from squigglypy.tree import (
     BaseValue,
     Distribution,
+    Elementwise,
     Empty,
     Mixture,
     Operation,
+    Reduction,
     Resolveable,
     Value,
     _empty,
 )
-from typing import Any, Callable, Iterable, List, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from squigglypy.context import Context
 
 
 def aslist(generator: Callable[..., Any]) -> Callable[..., Any]:
@@ -22,34 +27,59 @@ def aslist(generator: Callable[..., Any]) -> Callable[..., Any]:
     return wrapper
 
 
-_tracer: Value = Value(0, name="x")
+_tracer: Value = Value(0, constant=False, name="x")
 
 
-def _mark_constancy(tree: Union[float, BaseValue], tracer: Value) -> bool:
-    if tree is tracer:
-        return False
-    if not isinstance(tree, BaseValue):
-        return True
-    if tree.constant is not None:
-        return tree.constant
+def _dependencies(tree: Union[float, BaseValue], tracer: Value) -> Optional[List[BaseValue]]:
+    """Return the parts whose constancy determines that of the tree, or `None` for leaves"""
+    if tree is tracer or not isinstance(tree, BaseValue) or tree.constant is not None:
+        return None
     if isinstance(tree, Mixture):
-        for value in tree.values:
-            value.constant = _mark_constancy(value, tracer)
-        return all(value.constant for value in tree.values)
+        return list(tree.values)
+    if isinstance(tree, Distribution):
+        return tree.parameters
     assert isinstance(tree, Value)
     if isinstance(tree.value, Operation):
-        tree.value.this.constant = _mark_constancy(tree.value.this, tracer)
         if tree.value.other is _empty:
-            return tree.value.this.constant
-        tree.value.other.constant = _mark_constancy(tree.value.other, tracer)
-        return tree.value.this.constant and tree.value.other.constant
+            return [tree.value.this]
+        return [tree.value.this, tree.value.other]
+    if isinstance(tree.value, (Reduction, Elementwise)):
+        return list(tree.value.values)
     if isinstance(tree.value, Value):
-        tree.value.constant = _mark_constancy(tree.value, tracer)
-        return tree.value.constant
-    return True
+        return [tree.value]
+    return None
 
 
-def mark_constancy(model: Union[Callable[..., float], Callable[..., Value]]):
+def _mark_constancy(tree: Union[float, BaseValue], tracer: Value) -> bool:
+    """Mark the parts of a tree that don't depend on the tracer as constant
+
+    Returns whether the tree itself is constant. Shared parts are only visited once.
+    """
+    constancy: Dict[int, bool] = {}
+    stack: List[Tuple[Union[float, BaseValue], bool]] = [(tree, False)]
+    while stack:
+        part, expanded = stack.pop()
+        if id(part) in constancy:
+            continue
+        dependencies = _dependencies(part, tracer)
+        if dependencies is None:
+            if part is tracer:
+                constancy[id(part)] = False
+            elif isinstance(part, BaseValue) and part.constant is not None:
+                constancy[id(part)] = part.constant
+            else:
+                constancy[id(part)] = True
+        elif not expanded:
+            stack.append((part, True))
+            stack.extend((dependency, False) for dependency in reversed(dependencies))
+        else:
+            for dependency in dependencies:
+                dependency.constant = constancy[id(dependency)]
+            constancy[id(part)] = all(dependency.constant for dependency in dependencies)
+    return constancy[id(tree)]
+
+
+def mark_constancy(model: Callable[..., Union[float, BaseValue]]):
     tracer = copy(_tracer)
     tree = model(tracer)
     if not isinstance(tree, Value):
@@ -59,24 +89,29 @@ def mark_constancy(model: Union[Callable[..., float], Callable[..., Value]]):
 
 
 def _bfs(tree: Union[float, Resolveable, Empty]) -> List[BaseValue]:
-    def seq(iterable: Iterable[Any]) -> List[BaseValue]:
-        """Return list with consistent type"""
-        return list(iterable)
-
-    if isinstance(tree, Distribution):
-        return [tree]
-    if isinstance(tree, Mixture):
-        nested = [_bfs(value_) for value_ in tree.values]
-        return seq([tree]) + seq(chain.from_iterable(nested))
-    if isinstance(tree, Value):
-        return seq([tree]) + _bfs(tree.value)
-    if isinstance(tree, Operation):
-        return _bfs(tree.this) + _bfs(tree.other)
-    return []
+    """Return the values and distributions of a tree in depth-first preorder"""
+    parts: List[BaseValue] = []
+    stack: List[Any] = [tree]
+    while stack:
+        part = stack.pop()
+        if isinstance(part, Distribution):
+            parts.append(part)
+            stack.extend(reversed(part.parameters))
+        elif isinstance(part, Mixture):
+            parts.append(part)
+            stack.extend(reversed(part.values))
+        elif isinstance(part, Value):
+            parts.append(part)
+            stack.append(part.value)
+        elif isinstance(part, Operation):
+            stack.extend((part.other, part.this))
+        elif isinstance(part, (Reduction, Elementwise)):
+            stack.extend(reversed(part.values))
+    return parts
 
 
 def bfs(
-    model: Union[Callable[..., float], Callable[..., Value]]
+    model: Union[Callable[..., float], Callable[..., Value]],
 ) -> Tuple[List[BaseValue], List[BaseValue], Value]:
     tree, tracer = mark_constancy(model)
     parts = _bfs(tree)
@@ -91,3 +126,31 @@ def as_model(part: BaseValue, tracer: Value):
         return part
 
     return model
+
+
+def evaluate_grid(
+    model: Union[Callable[..., float], Callable[..., Value]], xs: Sequence[float]
+) -> np.ndarray:
+    """Resolve a model for every x at once into a `(len(xs) × sample_count)` array
+
+    The model is traced once, and the tracer takes the whole grid as a column, so the variable
+    parts are evaluated in a single broadcast pass while the constant parts are resolved (and
+    cached) only once.
+    """
+    grid = np.asarray(xs, dtype=float)
+    shape = (grid.size, Context.getcontext().sample_count)
+
+    def loop():
+        return np.stack([np.broadcast_to(~Value(model(x)), shape[1:]) for x in grid])
+
+    try:
+        tree, tracer = mark_constancy(model)
+    except TypeError:  # The model branches on the variable
+        return loop()
+    if not isinstance(tree, BaseValue) or any(
+        isinstance(part, (Distribution, Mixture)) and not part.constant for part in _bfs(tree)
+    ):
+        # Mixtures concatenate along the sample axis and distributions draw one sample per
+        # parameter, so neither can broadcast over a grid
+        return loop()
+    return np.broadcast_to(~as_model(tree, tracer)(grid[:, np.newaxis]), shape)
@@ -0,0 +1,53 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from squigglypy.aio import resolve_async
+from squigglypy.context import Context
+from squigglypy.dsl import normal
+from squigglypy.tree import Distribution
+
+calls = []
+
+
+def slow(index: int, size: int) -> np.ndarray:
+    calls.append(index)
+    time.sleep(0.02)
+    return np.zeros(size)
+
+
+def test_resolve_async_propagates_context():
+    model = normal(0, 1) * normal(5, 1)
+    with Context(cache={}, sample_count=10, seed=42):
+        expected = ~model
+
+    async def main():
+        with Context(cache={}, sample_count=10, seed=42):
+            return await resolve_async(model)
+
+    assert np.array_equal(asyncio.run(main()), expected)
+
+
+def test_resolve_async_times_out_and_stops():
+    model = sum(Distribution(slow, index) for index in range(50))
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(None)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        ticker = asyncio.ensure_future(tick())
+        with Context(cache={}):
+            with pytest.raises(asyncio.TimeoutError):
+                await resolve_async(model, executor=executor, timeout=0.1)
+        ticker.cancel()
+
+    calls.clear()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        asyncio.run(main())
+    assert len(ticks) >= 5  # The event loop wasn't blocked
+    assert len(calls) < 20  # The resolution stopped soon after the timeout
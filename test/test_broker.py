@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from squigglypy.broker import Broker
+from squigglypy.context import Context
+from squigglypy.tree import Distribution
+
+calls = []
+
+
+def slow(size: int) -> np.ndarray:
+    calls.append(None)
+    time.sleep(0.1)
+    return np.arange(size, dtype=float)
+
+
+def test_threads_share_one_resolution():
+    broker = Broker()
+    calls.clear()
+
+    def request(_):
+        with Context(cache={}, sample_count=10):
+            return broker.resolve(Distribution(slow))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(request, range(8)))
+    assert len(calls) == 1
+    assert all(result is results[0] or np.array_equal(result, results[0]) for result in results)
+    with pytest.raises(ValueError):
+        results[0][0] = 1  # Shared results are read-only
+
+
+def test_tasks_share_one_resolution_until_it_expires():
+    now = [0.0]
+    broker = Broker(ttl=10, clock=lambda: now[0])
+    calls.clear()
+
+    async def main():
+        with Context(cache={}, sample_count=10):
+            first = await asyncio.gather(
+                *(broker.resolve_async(Distribution(slow)) for _ in range(8))
+            )
+            with Context(sample_count=20):
+                second = await broker.resolve_async(Distribution(slow))
+            return first, second
+
+    first, second = asyncio.run(main())
+    assert len(calls) == 2  # Different sample counts don't share
+    assert len(first) == 8 and len(second) == 20
+    assert len(broker) == 2
+    now[0] = 11
+    with Context(cache={}, sample_count=10):
+        broker.resolve(Distribution(slow))
+    assert len(calls) == 3
+    assert len(broker) == 1
+
+
+def test_abandoned_resolutions_are_cancelled():
+    broker = Broker()
+    started = threading.Event()
+
+    def slower(size: int) -> np.ndarray:
+        started.set()
+        return slow(size)
+
+    async def main():
+        with Context(cache={}, sample_count=10):
+            with pytest.raises(asyncio.TimeoutError):
+                await broker.resolve_async(Distribution(slower) + Distribution(slow), timeout=0.05)
+
+    calls.clear()
+    asyncio.run(main())
+    assert started.is_set() and len(calls) == 1
+    assert not broker.flights and not len(broker)
@@ -0,0 +1,95 @@
+from pathlib import Path
+
+import numpy as np
+from pytest import raises
+from squigglypy.cache import DiskCache, SampleCache
+from squigglypy.context import CacheKey, Context
+from squigglypy.dsl import normal, uniform
+from squigglypy.tree import Distribution
+from squigglypy.utils import as_model, mark_constancy
+
+
+def test_sample_cache_budget():
+    cache = SampleCache(max_bytes=3 * 800)
+    for key in "abc":
+        cache[key] = np.zeros(100)
+    assert cache.nbytes == 2400
+    assert cache.get("a") is not None  # "b" is now the least recently used entry
+    cache["d"] = np.zeros(100)
+    assert list(cache) == ["c", "a", "d"]
+    assert cache.get("b") is None
+    cache["e"] = np.zeros(1000)  # Larger than the whole budget
+    assert "e" not in cache
+    assert (cache.hits, cache.misses, cache.evictions, cache.nbytes) == (1, 1, 1, 2400)
+
+
+def test_cache_rules():
+    with Context(cache=SampleCache(), cache_rule="never") as context:
+        assert not np.array_equal(~normal(0, 1), ~normal(0, 1))
+        assert not context.cache
+    with Context(cache=SampleCache(), cache_rule="constant") as context:
+        assert ~normal(0, 1) is ~normal(0, 1)
+        assert context.cache.hits == 1
+    tree, tracer = mark_constancy(lambda x: normal(0, 1) * x)
+    for rule, expected in [("constant", 2), ("always", 1)]:
+        with Context(cache=SampleCache(), cache_rule=rule):
+            first, second = ~as_model(tree, tracer)(1), ~as_model(tree, tracer)(2)
+            assert np.allclose(first * 2, second) == (expected == 2)
+    with raises(ValueError):
+        with Context(cache_rule="sometimes"):
+            pass
+
+
+def test_disk_cache(tmp_path: Path):
+    model = normal(0, 1) * uniform(1, 2)
+    with Context(cache=SampleCache(backing=DiskCache(tmp_path))):
+        samples = ~model
+        ~(normal(0, 1) + 1)
+        ~Distribution(lambda size: np.zeros(size))  # Lambdas have no stable digest
+    assert len(DiskCache(tmp_path)) == 4  # Two distributions and two operations
+    disk_cache = DiskCache(tmp_path)
+    with Context(cache=SampleCache(backing=disk_cache), seed=42):
+        warm = ~model
+    assert np.array_equal(samples, warm)
+    assert not warm.flags.writeable
+    assert disk_cache.hits == 1  # The operation, so its leaves weren't even sampled
+    limited = DiskCache(tmp_path, max_bytes=2 * 8128)
+    limited[CacheKey(normal(5, 1).digest, 1000)] = np.zeros(1000)
+    assert len(limited) == 2
+    assert limited.evictions == 3
+
+
+def test_disk_cache_files_deleted_by_other_processes(tmp_path: Path, monkeypatch):
+    disk_cache = DiskCache(tmp_path, max_bytes=2 * 8128)
+    for index in range(2):
+        disk_cache[CacheKey(normal(index, 1).digest, 1000)] = np.zeros(1000)
+    glob = Path.glob
+    # Another process deletes a file between listing the directory and statting the file
+    monkeypatch.setattr(
+        Path, "glob", lambda self, pattern: [*glob(self, pattern), self / "deleted.npy"]
+    )
+    assert DiskCache(tmp_path).nbytes == 2 * 8128
+    disk_cache[CacheKey(normal(2, 1).digest, 1000)] = np.zeros(1000)
+    assert disk_cache.evictions == 1
+    monkeypatch.undo()
+    assert len(disk_cache) == 2
+    assert set(disk_cache) == {path.stem for path in tmp_path.glob("*.npy")}  # Digests
+    with raises(KeyError):
+        del disk_cache[CacheKey(normal(0, 1).digest, 1000)]  # Evicted
+
+
+class Shifted:
+    def __init__(self, shift: float):
+        self.shift = shift
+
+    def sample(self, size: int) -> np.ndarray:
+        return np.full(size, self.shift)
+
+
+def test_disk_cache_bound_methods(tmp_path: Path):
+    assert CacheKey(Distribution(Shifted(0).sample).digest).stable_digest() is None
+    assert CacheKey(Distribution(uniform(0, 1).function).digest).stable_digest() is not None
+    with Context(cache=SampleCache(backing=DiskCache(tmp_path))):
+        assert not (~Distribution(Shifted(0).sample)).any()
+    with Context(cache=SampleCache(backing=DiskCache(tmp_path))):
+        assert (~Distribution(Shifted(100).sample) == 100).all()
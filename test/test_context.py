@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from squigglypy.context import Context
+from squigglypy.dsl import mixture, normal, uniform
+
+
+def test_seed_reproducibility():
+    model = mixture([normal(0, 1), uniform(2, 3)]) * normal(5, 1)
+    with Context(cache={}, seed=42):
+        first = ~model
+    with Context(cache={}, seed=42):
+        second = ~model
+    with Context(cache={}, seed=43):
+        third = ~model
+    assert np.array_equal(first, second)
+    assert not np.array_equal(first, third)
+
+
+def test_spawned_streams_are_independent():
+    with Context(cache={}, seed=42) as context:
+        seeds = context.spawn(2)
+    samples = []
+    for seed in seeds:
+        with Context(cache={}, seed=seed):
+            samples.append(~normal(0, 1))
+    assert not np.array_equal(*samples)
+    assert abs(np.corrcoef(*samples)[0, 1]) < 0.2
+
+
+def test_child_contexts_share_unchanged_fields():
+    with Context(cache={}, sample_count=10) as parent:
+        with Context(sample_count=20) as child:
+            assert child.sample_count == 20
+            assert child.cache is parent.cache
+            assert child.generator is parent.generator
+        assert Context.getcontext() is parent
+    with pytest.raises(AttributeError):
+        parent.sample_count = 30
+    with pytest.raises(TypeError):
+        parent.replace(samples=30)
+
+
+def test_dtype_must_be_floating():
+    with pytest.raises(ValueError):
+        Context(dtype=np.int64).__enter__()
@@ -4,8 +4,22 @@ from _pytest.python_api import ApproxScalar
 
 import numpy as np
 from pytest import approx, mark
-from squigglypy.context import DEFAULT_SAMPLE_COUNT
-from squigglypy.dsl import lognormal, mixture, normal, pareto, uniform
+from squigglypy.context import DEFAULT_SAMPLE_COUNT, Context
+from squigglypy.dsl import (
+    clip,
+    exp,
+    integral,
+    log,
+    lognormal,
+    maximum,
+    minimum,
+    mixture,
+    normal,
+    pareto,
+    sqrt,
+    uniform,
+    where,
+)
 from squigglypy.tree import Value
 
 
@@ -49,6 +63,23 @@ def test_mixture():
     assert samples.shape == (DEFAULT_SAMPLE_COUNT,)
     assert samples.mean() == approx(5, abs=0.2)
     assert samples[(samples > 4.5) & (samples < 5.5)].size == 0
+    with Context(sample_count=0):
+        assert (~mixture([normal(0, 1), normal(10, 1)])).shape == (0,)
+
+
+def test_weighted_mixture():
+    samples = ~mixture([normal(0, 1), normal(10, 1)], weights=[3, 1])
+    assert samples.shape == (DEFAULT_SAMPLE_COUNT,)
+    assert samples.mean() == approx(2.5, abs=0.5)
+    # Components are interleaved rather than concatenated
+    assert samples[: DEFAULT_SAMPLE_COUNT // 2].mean() == approx(2.5, abs=1)
+    assert samples[DEFAULT_SAMPLE_COUNT // 2 :].mean() == approx(2.5, abs=1)
+    # Seeded, as the most frequent of the heaviest components is down to chance
+    with Context(sample_count=100_000, seed=0):
+        samples = ~mixture([Value(i) for i in range(100)], weights=range(1, 101))
+    assert np.bincount(samples).argmax() > 90
+    frequencies = np.bincount(samples, minlength=100) / 100_000
+    assert frequencies == approx(np.arange(1, 101) / 5050, abs=0.002)
 
 
 @mark.parametrize(
@@ -280,3 +311,56 @@ def test_model(x: float, mean: ApproxScalar, mean_high: ApproxScalar, mean_low:
     assert samples.mean() == mean
     assert samples[samples > samples.mean()].mean() == mean_high
     assert samples[samples < samples.mean()].mean() == mean_low
+
+
+@mark.parametrize(
+    "integrand, low, high, expected",
+    [
+        (lambda x: normal(2, 0.1) * x ** 2 + uniform(0, 1), 0, 3, approx(19.5, abs=0.5)),
+        (lambda x: 1 / (1 + x * x) * uniform(0.9, 1.1), 0, np.inf, approx(np.pi / 2, abs=0.1)),
+        (lambda x: normal(1, 0.01) * (1 if x < 1 else 0), 0, 2, approx(1, abs=0.1)),
+        (lambda x: abs(x - 1.234), 0, 2, approx(1.054756)),
+    ],
+)
+def test_integral(
+    integrand: Callable[[Value], Value], low: float, high: float, expected: ApproxScalar
+):
+    with Context(sample_count=100):
+        batched = ~integral(integrand, low, high)
+        looped = ~integral(integrand, low, high, batched=False)
+    for samples in (batched, looped):
+        assert isinstance(samples, np.ndarray)
+        assert samples.shape == (100,)
+        assert samples.mean() == expected
+
+
+@mark.parametrize("cache_rule", ["never", "constant", "always"])
+def test_integral_cache_rules(cache_rule: str):
+    # Every sample integrates one draw of the leaf, so the integrals are distributed as 2 * leaf
+    with Context(cache={}, cache_rule=cache_rule, sample_count=200, seed=0):
+        batched = ~integral(lambda x: normal(1, 0.1) * x, 0, 2)
+        looped = ~integral(lambda x: normal(1, 0.1) * x, 0, 2, batched=False)
+    for samples in (batched, looped):
+        assert samples.mean() == approx(2, abs=0.05)
+        assert samples.std() == approx(0.2, rel=0.15)
+
+
+def test_elementwise():
+    x, y = normal(0, 1), uniform(1, 2)
+    model = where(x > 0, exp(x), maximum(x, -1) * 2) + clip(log(y), 0.1, 0.5)
+    assert str(model) == (
+        "where(normal(0, 1) > 0, exp(normal(0, 1)), maximum(normal(0, 1), -1) * 2) "
+        "+ clip(log(uniform(1, 2)), 0.1, 0.5)"
+    )
+    assert str(-exp(x) ** 2) == "-exp(normal(0, 1)) ** 2"
+    assert (
+        model.digest is (where(x > 0, exp(x), maximum(x, -1) * 2) + clip(log(y), 0.1, 0.5)).digest
+    )
+    assert exp(x).digest is not log(x).digest
+    with Context(cache={}):
+        expected = np.where(~x > 0, np.exp(~x), np.maximum(~x, -1) * 2) + np.clip(
+            np.log(~y), 0.1, 0.5
+        )
+        assert np.allclose(~model, expected)
+        assert np.allclose(~minimum(sqrt(y), 1.2), np.minimum(np.sqrt(~y), 1.2))
+    assert ~exp(0) == 1 and ~where(Value(1) > 0, 2, 3) == 2
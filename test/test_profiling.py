@@ -0,0 +1,45 @@
+import json
+
+from squigglypy.context import Context
+from squigglypy.dsl import mixture, normal, uniform
+from squigglypy.profiling import Profiler
+from squigglypy.tree import compile
+
+
+def test_profiler():
+    leaf = normal(0, 1)
+    model = (leaf * 2 + mixture([leaf, uniform(1, 2)])) * leaf
+    with Context(cache={}, sample_count=100, profiler=Profiler()) as context:
+        ~model
+        ~model
+    profiler = context.profiler
+    nodes = {entry["node"]: entry for entry in profiler.as_dict()["nodes"]}
+    assert nodes["normal(0, 1)"]["calls"] >= 2
+    assert nodes[repr(model)]["calls"] == 2
+    assert nodes[repr(model)]["nbytes"] == 800  # Computed once, then cached
+    cache = {
+        (entry["node"], entry["sample_count"]): entry for entry in profiler.as_dict()["cache"]
+    }
+    assert cache["normal(0, 1)", 100]["misses"] == 1
+    assert cache[repr(model), 100]["hits"] == 1
+    assert "normal(0, 1) * 2" in profiler.report()
+    assert json.loads(profiler.to_json())["nodes"]
+    for line in profiler.folded().splitlines():
+        stack, microseconds = line.rsplit(" ", 1)
+        assert stack and int(microseconds) >= 0
+
+
+def test_profiler_in_plans():
+    model = normal(0, 1) * 2 + 1
+    with Context(cache={}, sample_count=100, profiler=Profiler()) as context:
+        ~compile(model)
+    nodes = {entry["node"]: entry for entry in context.profiler.as_dict()["nodes"]}
+    assert nodes["normal(0, 1) * 2"]["calls"] == 1
+    assert nodes["normal(0, 1) * 2"]["nbytes"] == 800
+    assert "Plan(normal(0, 1) * 2 + 1);normal(0, 1) * 2 + 1 " in context.profiler.folded()
+
+
+def test_profiler_is_opt_in():
+    with Context(cache={}) as context:
+        ~normal(0, 1)
+    assert context.profiler is None
@@ -0,0 +1,105 @@
+import pickle
+
+import numpy as np
+from pytest import approx
+from squigglypy.context import Context
+from squigglypy.dsl import from_sketch, lognormal, mixture, normal, pareto, uniform
+from squigglypy.resolution import resolve_parallel, resolve_until, stream, summarize
+from squigglypy.stats import Histogram, Moments, SampleSketch, TDigest
+
+
+def test_resolve_parallel():
+    model = mixture([normal(0, 1), uniform(2, 3)]) * normal(5, 1) + 1
+    with Context(sample_count=10_001, seed=42):
+        samples = resolve_parallel(model, workers=2, shards=3)
+    with Context(sample_count=10_001, seed=42):
+        repeated = resolve_parallel(model, workers=3)
+    assert samples.shape == (10_001,)
+    assert np.array_equal(samples, repeated)
+    with Context(sample_count=10_001, seed=42):
+        moments = resolve_parallel(model, workers=2, shards=3, statistics=True)
+    assert isinstance(moments, Moments)
+    assert moments.count == 10_001
+    assert moments.mean == approx(samples.mean())
+    assert moments.std == approx(samples.std(ddof=1))
+    assert (moments.min, moments.max) == (samples.min(), samples.max())
+
+
+def test_summarize():
+    model = normal(0, 1) + normal(0, 1) * uniform(0, 0)  # Shared leaves within a chunk
+    with Context(sample_count=100_000, seed=42):
+        chunks = list(stream(model, chunk_size=30_000))
+    assert [chunk.size for chunk in chunks] == [30_000, 30_000, 30_000, 10_000]
+    samples = np.concatenate(chunks)
+    with Context(sample_count=100_000, seed=42):
+        moments, digest, histogram = summarize(
+            model, Moments(), TDigest(), Histogram(-2, 2, bins=4), chunk_size=30_000
+        )
+    assert moments.count == 100_000
+    assert moments.mean == approx(samples.mean())
+    assert moments.variance == approx(samples.var(ddof=1))
+    assert digest.count == 100_000
+    assert digest.quantile([0.01, 0.5, 0.99]) == approx(
+        np.quantile(samples, [0.01, 0.5, 0.99]), abs=0.02
+    )
+    assert digest.cdf(0) == approx(0.5, abs=0.01)
+    assert histogram.counts.sum() + histogram.underflow + histogram.overflow == 100_000
+    assert histogram.counts.tolist() == np.histogram(samples, [-2, -1, 0, 1, 2])[0].tolist()
+
+
+def test_tdigest_merge():
+    generator = np.random.default_rng(42)
+    this, other = generator.normal(0, 1, 50_000), generator.lognormal(0, 1, 50_000)
+    merged = TDigest().update(this).merge(TDigest().update(other))
+    samples = np.concatenate([this, other])
+    quantiles = [0.001, 0.1, 0.5, 0.9, 0.999]
+    ranks = [(samples <= estimate).mean() for estimate in merged.quantile(quantiles)]
+    assert ranks == approx(quantiles, abs=0.001)
+
+
+def test_resolve_until():
+    with Context(sample_count=1000, seed=42):
+        estimate = resolve_until(normal(10, 1), rel_tol=0.001)
+    assert estimate.converged and estimate.error <= 0.01
+    assert 10_000 <= estimate.samples.size <= 64_000
+    assert estimate.value == approx(10, abs=0.05)
+    with Context(sample_count=1000, seed=42):
+        repeated = resolve_until(normal(10, 1), rel_tol=0.001)
+    assert np.array_equal(estimate.samples, repeated.samples)
+    with Context(sample_count=1000, seed=42):
+        median = resolve_until(normal(0, 1), statistic=0.5, rel_tol=0, abs_tol=0.01)
+        spread = resolve_until(normal(0, 2), statistic=np.std, max_samples=3000)
+        heavy = resolve_until(pareto(1.1), max_samples=50_000)
+    assert median.converged and median.value == approx(0, abs=0.05)
+    assert spread.samples.size == 3000 and spread.value == approx(2, rel=0.1)
+    assert not heavy.converged and heavy.samples.size == 50_000
+
+
+def test_sample_sketch():
+    model = lognormal(0, 1)
+    with Context(sample_count=100_000, seed=42):
+        samples = ~model
+        streamed = SampleSketch.from_stream(stream(model, chunk_size=30_000))
+    sketch = SampleSketch.from_samples(samples)
+    assert sketch.size == 1000 and sketch.nbytes == 8000
+    assert sketch.mean == approx(samples.mean()) and sketch.count == 100_000
+    quantiles = [0, 0.01, 0.5, 0.99, 1]
+    assert sketch.quantile(quantiles) == approx(np.quantile(samples, quantiles), rel=0.001)
+    # Other samples of the same model
+    assert streamed.count == 100_000 and streamed.mean == approx(samples.mean(), rel=0.05)
+    assert streamed.quantile(quantiles[1:-1]) == approx(sketch.quantile(quantiles[1:-1]), rel=0.05)
+    assert sketch.cdf([-1, 1, 100]) == approx([0, (samples <= 1).mean(), 1], abs=0.002)
+    assert sketch.cdf(sketch.quantile(0.3)) == approx(0.3)
+    assert sketch.pdf(1) == approx(1 / np.sqrt(2 * np.pi), rel=0.1)  # Of the lognormal
+    assert sketch.pdf(-1) == 0
+    assert sketch == SampleSketch.from_samples(samples) and hash(sketch) == hash(sketch)
+    assert pickle.loads(pickle.dumps(sketch)) == sketch
+    leaf = from_sketch(sketch) + 1
+    assert str(leaf) == f"sketched(SampleSketch(count=100000, mean={sketch.mean}, size=1000)) + 1"
+    for settings in ({}, {"sampling": "sobol"}, {"dtype": np.float32}):
+        with Context(cache={}, sample_count=100_000, seed=0, **settings):
+            resampled = ~leaf - 1
+            assert np.median(resampled) == approx(1, abs=0.03)
+            assert resampled.mean() == approx(samples.mean(), rel=0.05)
+    with Context(cache={}, seed=1):
+        assert np.array_equal(~leaf, ~(from_sketch(SampleSketch.from_samples(samples)) + 1))
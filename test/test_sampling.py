@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from scipy.stats import qmc  # type: ignore
+from squigglypy.context import Context
+from squigglypy.dsl import lognormal, normal, pareto, uniform
+from squigglypy.sampling import Design
+
+
+def rmse(sampling: str) -> float:
+    model = normal(0, 1) * lognormal(0, 0.5) + uniform(0, 1) - pareto(4)
+    errors = []
+    for seed in range(20):
+        with Context(cache={}, sample_count=1024, sampling=sampling, seed=seed):
+            errors.append((~model).mean() - (0.5 - 1 / 3))
+    return np.sqrt(np.mean(np.square(errors)))
+
+
+def test_quasi_monte_carlo_is_more_accurate():
+    assert rmse("sobol") < rmse("random") / 5
+    assert rmse("halton") < rmse("random") / 2
+
+
+@pytest.mark.parametrize("sampling", ["sobol", "halton", "latin"])
+def test_designs(sampling):
+    design = Design(sampling, np.random.default_rng(0))
+    columns = [design.uniforms(digest, 1000) for digest in "abc"]
+    assert np.array_equal(design.uniforms("a", 1000), columns[0]) or sampling == "latin"
+    for column in columns:
+        assert 0 < column.min() and column.max() < 1
+        # Every stratum of width 1 / 10 holds about its share of the points
+        counts = np.bincount((column * 10).astype(int), minlength=10)
+        assert np.abs(counts - 100).max() <= (0 if sampling == "latin" else 5)
+    assert abs(np.corrcoef(columns)[0, 1]) < 0.05
+
+
+@pytest.mark.parametrize("sampling", ["sobol", "halton"])
+def test_design_columns_match_the_sequences(sampling):
+    design = Design(sampling, np.random.default_rng(0))
+    for sample_count in (1, 1000, 1024):
+        columns = np.stack([design._column(dimension, sample_count) for dimension in range(6)])
+        if sampling == "sobol":
+            columns = columns / 2 ** 30
+            points = qmc.Sobol(6, scramble=False).random_base2(10)[:sample_count]
+        else:
+            points = qmc.Halton(6, scramble=False).random(sample_count)
+        assert np.array_equal(columns.T, points)
+    assert design.directions.nbytes <= 8 * 6 * 30  # Rather than the points of the sequence
+
+
+def test_sampling_must_be_known():
+    with pytest.raises(ValueError):
+        Context(sampling="sobel").__enter__()
@@ -0,0 +1,55 @@
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from squigglypy.context import Context
+from squigglypy.dsl import exp, lognormal, mixture, normal, sum_of, uniform
+from squigglypy.scheduler import resolve_threaded
+from squigglypy.tree import Distribution
+
+
+def submodel(index: int):
+    return normal(index, 1) * uniform(0.9, 1.1) + exp(normal(0, 0.1))
+
+
+def test_resolve_threaded_is_reproducible():
+    model = mixture([submodel(index) for index in range(32)]) + sum_of(
+        [lognormal(0, 0.5) for _ in range(8)]
+    )
+    results = []
+    for workers in (1, 4, 8):
+        for sampling in ("random", "sobol", "latin"):
+            with Context(cache={}, sample_count=10_000, seed=42, sampling=sampling):
+                results.append(resolve_threaded(model, workers=workers))
+    assert all(np.array_equal(result, results[0]) for result in results[::3])
+    assert all(np.array_equal(result, results[1]) for result in results[1::3])
+    assert not np.array_equal(results[0], results[1])
+    mean = 31 / 2 + np.exp(0.005) + 8 * np.exp(0.125)
+    assert all(result.mean() == pytest.approx(mean, rel=0.02) for result in results)
+
+
+def test_resolve_threaded_shares_the_cache():
+    shared = normal(0, 1)
+    model = normal(shared, 1) - shared + uniform(0, 1) * 2
+    with Context(cache={}, sample_count=10_000, seed=0):
+        with ThreadPoolExecutor(4) as executor:
+            samples = resolve_threaded(model, executor=executor)
+        assert ~model is samples
+        assert np.array_equal(samples, ~(normal(shared, 1) - shared) + ~uniform(0, 1) * 2)
+        assert (~(normal(shared, 1) - shared)).std() == pytest.approx(1, rel=0.05)
+        assert resolve_threaded(model) is samples  # Cached subtrees aren't resolved again
+
+
+def test_resolve_threaded_errors():
+    def failing(size: int) -> np.ndarray:
+        raise ArithmeticError("Failed")
+
+    with Context(cache={}):
+        with pytest.raises(ArithmeticError, match="Failed"):
+            resolve_threaded(normal(0, 1) + Distribution(failing), workers=2)
+    cancelled = threading.Event()
+    cancelled.set()
+    with Context(cache={}, cancelled=cancelled):
+        with pytest.raises(CancelledError):
+            resolve_threaded(normal(0, 1) + normal(1, 1))
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from squigglypy.context import Context
+from squigglypy.dsl import lognormal, mixture, normal, product_of, sum_of, uniform
+from squigglypy.simplify import simplify
+from squigglypy.tree import Distribution, Value
+
+
+@pytest.mark.parametrize(
+    "model,expected",
+    [
+        (lambda: normal(1, 1) + normal(2, 2), "normal(3.0, 2.23606797749979)"),
+        (lambda: 3 * normal(0, 1) - 1, "normal(-1.0, 3.0)"),
+        (lambda: 2 - uniform(0, 1), "uniform(1.0, 2.0)"),
+        (
+            lambda: lognormal(0, 1) * lognormal(1, 1) / 2,
+            "lognormal(0.3068528194400547, 1.4142135623730951)",
+        ),
+        (lambda: (Value(3) + Value(4)) * normal(0, 1), "normal(0.0, 7.0)"),
+        (
+            lambda: normal(0, 1) + normal(1, 1) + normal(2, 1),
+            "normal(3.0, 1.7320508075688774)",
+        ),
+        (lambda: normal(0, 1) * 2 * 3, "normal(0.0, 6.0)"),
+        (lambda: 2 * normal(0, 1) + 1 + 1, "normal(2.0, 2.0)"),
+        (lambda: sum_of([normal(0, 1), normal(1, 1)]), "normal(1.0, 1.4142135623730951)"),
+        (lambda: uniform(0, 1) + 1 + 2, "uniform(3.0, 4.0)"),
+        (
+            lambda: product_of([lognormal(0, 1), lognormal(1, 1), lognormal(2, 1)]),
+            "lognormal(3.0, 1.7320508075688774)",
+        ),
+    ],
+)
+def test_closed_forms(model, expected):
+    original = model()
+    simplified = simplify(original)
+    assert isinstance(simplified, Distribution)
+    assert str(simplified) == expected
+    with Context(cache={}, sample_count=100_000, seed=0):
+        samples = ~original
+    with Context(cache={}, sample_count=100_000, seed=1):
+        simplified_samples = ~simplified
+    assert np.median(simplified_samples) == pytest.approx(np.median(samples), rel=0.05, abs=0.05)
+    assert np.std(simplified_samples) == pytest.approx(np.std(samples), rel=0.05)
+
+
+def test_dependent_and_named_parts_are_kept():
+    shared = normal(0, 1)
+    assert str(simplify(shared + shared * 2)) == "normal(0, 1) + normal(0, 1) * 2"
+    assert str(simplify(normal(0, 1, name="noise") + 1)) == "noise + 1"
+    model = Value(normal(0, 1) + normal(1, 1), name="total") * 2 + (Value(1) + 1)
+    simplified = simplify(model)
+    assert str(simplified) == "total * 2 + 2"
+    total = simplified.value.this.value.this
+    assert isinstance(total, Distribution) and total.args == (1.0, pytest.approx(2 ** 0.5))
+    model = mixture([normal(0, 1) * 2, uniform(1, 2) + 1])
+    assert str(simplify(model)) == "Mixture([normal(0.0, 2.0), uniform(2.0, 3.0)])"
+
+
+def test_parameters_are_simplified():
+    model = normal(normal(0, 1) + normal(1, 1), uniform(1, 2) * 2)
+    assert str(simplify(model)) == "normal(normal(1.0, 1.4142135623730951), uniform(2.0, 4.0))"
+    unchanged = normal(normal(0, 1), 1)
+    assert simplify(unchanged) is unchanged
+
+
+def test_reductions_keep_the_terms_without_closed_forms():
+    model = normal(0, 1) + uniform(0, 1) + normal(1, 1) + 2
+    simplified = simplify(model)
+    assert str(simplified) == "uniform(0, 1) + normal(1.0, 1.4142135623730951) + 2"
+    with Context(cache={}, sample_count=100_000, seed=0):
+        samples = ~model
+    with Context(cache={}, sample_count=100_000, seed=1):
+        simplified_samples = ~simplified
+    assert np.mean(simplified_samples) == pytest.approx(np.mean(samples), abs=0.02)
+    assert np.std(simplified_samples) == pytest.approx(np.std(samples), rel=0.02)
+    shared = normal(0, 1)
+    assert (
+        str(simplify(shared + shared + normal(1, 1)))
+        == "normal(0, 1) + normal(0, 1) + normal(1, 1)"
+    )
+    assert str(simplify(normal(0, 1, name="noise") + 1 + 2)) == "noise + 3"
@@ -1,6 +1,20 @@
-from squigglypy.dsl import mixture, normal, uniform
-from squigglypy.tree import Value
-from squigglypy.utils import bfs, _tracer
+import numpy as np
+import pytest
+from squigglypy.cache import SampleCache
+from squigglypy.context import DEFAULT_SAMPLE_COUNT, Context
+from squigglypy.dsl import (
+    exp,
+    lognormal,
+    maximum,
+    mixture,
+    normal,
+    product_of,
+    sum_of,
+    uniform,
+    where,
+)
+from squigglypy.tree import Sum, Value, compile
+from squigglypy.utils import bfs, evaluate_grid, mark_constancy, _tracer
 
 
 def test_bfs_unnamed():
@@ -74,3 +88,232 @@ def test_bfs_named():
         "weight * x ** 2",
         "x ** 2",
     ]
+
+
+def test_compile_matches_recursive_resolution():
+    a, b = normal(0, 1), uniform(1, 2)
+    tree = a
+    for _ in range(40):
+        tree = tree * 1.01 + b - a / 3
+    plan = compile(tree)
+    assert np.allclose(~plan, ~tree)
+    assert plan.width <= 6
+
+
+def test_intermediate_results_are_cached_only_when_always():
+    tree = normal(0, 1)
+    for i in range(40):
+        tree = tree * 1.0 - i
+    for cache_rule, cached in (("constant", 2), ("always", 81)):
+        cache = {}
+        with Context(cache=cache, cache_rule=cache_rule, seed=0):
+            assert (~tree).mean() == pytest.approx(-40 * 39 / 2, rel=0.1)
+        # Only the leaf and the result unless always, so that the plan recycles its buffers
+        assert len(cache) == cached
+
+
+def test_compile_scalars_and_unary():
+    assert ~compile(Value(3) + Value(4)) == 7
+    assert ~compile(Value(3)) == 3
+    samples = ~compile(-abs(normal(5, 1)) < 0)
+    assert samples.dtype == np.bool_
+    assert samples.all()
+
+
+def test_structural_digests():
+    this = normal(0, 1) + uniform(1, 2)
+    other = normal(0, 1) + uniform(1, 2)
+    assert this.digest is other.digest
+    assert (this * 2).digest is (other * 2).digest
+    assert Value(1).digest is not Value(1.0).digest
+    assert Value(0.0).digest is not Value(-0.0).digest
+    with Context(cache={}):
+        assert not np.signbit(~(uniform(1, 2) * 0.0)).any()
+        assert np.signbit(~(uniform(1, 2) * -0.0)).all()
+    assert (this * 2).digest is not (this * 3).digest
+    assert len(compile(this * other).instructions) == 4
+    assert ~this is ~other  # Memoized under the shared digest
+
+
+def test_evaluate_grid():
+    def model(x: float) -> Value:
+        weight = mixture([normal(2, 0.1), normal(0, 0.1)])
+        return weight * x ** 2 + uniform(100, 200) / 5
+
+    xs = [-10, 0, 20, 100]
+    with Context(cache={}, seed=42):
+        grid = evaluate_grid(model, xs)
+        looped = [~model(x) for x in xs]
+    assert grid.shape == (4, DEFAULT_SAMPLE_COUNT)
+    assert np.allclose(grid, looped)  # The same leaves are shared through the cache
+
+
+def test_evaluate_grid_fallback():
+    def model(x: float) -> Value:
+        return normal(0, 1) if x > 0 else uniform(0, 1)  # Branches on the variable
+
+    with Context(cache={}, seed=42):
+        grid = evaluate_grid(model, [-1, 1])
+        assert np.array_equal(grid, [~uniform(0, 1), ~normal(0, 1)])
+
+
+def test_hierarchical_distributions():
+    mu, sigma = normal(10, 2), uniform(1, 3)
+    model = normal(mu, sigma)
+    assert str(model) == "normal(normal(10, 2), uniform(1, 3))"
+    assert model.digest is normal(normal(10, 2), uniform(1, 3)).digest
+    assert model.digest is not normal(normal(10, 3), uniform(1, 3)).digest
+    with Context(cache={}, sample_count=100_000, seed=0):
+        samples = ~model
+        assert samples.mean() == pytest.approx(10, abs=0.1)
+        assert samples.std() == pytest.approx((4 + 13 / 3) ** 0.5, rel=0.05)
+        # Every sample is drawn with the cached samples of its parameters
+        assert (~(model - mu)).std() == pytest.approx((13 / 3) ** 0.5, rel=0.05)
+    for settings in ({"dtype": np.float32}, {"sampling": "sobol"}):
+        with Context(cache={}, sample_count=10_000, seed=0, **settings):
+            assert (~model).mean() == pytest.approx(10, abs=0.2)
+
+    def variable(x: float) -> Value:
+        return normal(x, 1) + normal(uniform(0, 1), 1)
+
+    constants, variables, _ = bfs(variable)
+    assert [str(part) for part in constants] == [
+        "normal(uniform(0, 1), 1)",
+        "uniform(0, 1)",
+    ]
+    assert [str(part) for part in variables] == [
+        "normal(x, 1) + normal(uniform(0, 1), 1)",
+        "normal(x, 1)",
+    ]
+    with Context(cache={}, sample_count=10_000, seed=0):
+        grid = evaluate_grid(variable, [-10, 10])
+    assert grid.mean(axis=1) == pytest.approx([-9.5, 10.5], abs=0.1)
+
+
+def test_distributions_of_variables_are_volatile():
+    tree, tracer = mark_constancy(lambda x: normal(x, 0.001))
+    assert tree.digest.volatile
+    with Context(cache={}):
+        tracer.value = 0.0
+        assert (~tree).mean() == pytest.approx(0, abs=0.01)
+        tracer.value = 100.0
+        assert (~tree).mean() == pytest.approx(100, abs=0.01)
+
+
+def test_shared_nodes_do_not_depend_on_the_cache():
+    mu = normal(10, 2)
+    model = normal(mu, 1) - mu
+    for settings in ({}, {"cache": SampleCache(max_bytes=12000)}, {"cache_rule": "never"}):
+        with Context(**{"cache": {}, **settings}, sample_count=1000, seed=0):
+            assert (~model).std() == pytest.approx(1, rel=0.1)
+            assert (~compile(model)).std() == pytest.approx(1, rel=0.1)
+            assert (~mixture([model, model + 1])).std() == pytest.approx(1.12, rel=0.1)
+    with Context(cache={}, cache_rule="never"):
+        assert ~model is not ~model  # Nothing is kept once the resolution returns
+
+
+def test_elementwise_constancy():
+    def model(x: float) -> Value:
+        return where(x > 0, exp(normal(0, 1)), maximum(x, 1))
+
+    constants, variables, _ = bfs(model)
+    assert [str(part) for part in constants] == ["0", "exp(normal(0, 1))", "normal(0, 1)", "1"]
+    assert [str(part) for part in variables] == [
+        "where(x > 0, exp(normal(0, 1)), maximum(x, 1))",
+        "x > 0",
+        "maximum(x, 1)",
+    ]
+    with Context(cache={}, seed=42):
+        grid = evaluate_grid(model, [-1, 2])
+        assert np.array_equal(grid, [np.ones(DEFAULT_SAMPLE_COUNT), ~exp(normal(0, 1))])
+
+
+def test_float32_samples():
+    model = normal(0, 1) * np.float64(2) + mixture([uniform(0, 1), normal(5, 1)])
+    cache = {}
+    with Context(cache=cache, dtype=np.float32, seed=0) as context:
+        samples = ~model
+        assert samples.dtype == np.float32
+        assert (~(model > 1)).dtype == np.bool_
+        assert (~compile(model / 3)).dtype == np.float32
+        assert model.cache_key.dtype == np.float32
+        with Context(dtype=np.float64):
+            assert (~model).dtype == np.float64
+    assert abs(samples.mean() - 3) < 0.3
+    assert {key.dtype for key in cache if key.dtype is not None} == {
+        np.dtype(np.float32),
+        np.dtype(np.float64),
+    }
+    assert context.dtype == np.float32
+
+
+def test_long_chains_do_not_recurse():
+    def model(x):
+        total = x
+        for i in range(10_000):
+            total = normal(i, 1) + total  # Right-deep, so that it isn't flattened into a sum
+        return total
+
+    constants, variables, tracer = bfs(model)
+    assert len(constants) == 10_000 and len(variables) == 10_000
+    tree = model(1)
+    assert tree.digest.stable_digest()
+    with Context(cache={}, sample_count=10):
+        assert (~tree).mean() == pytest.approx(1 + 9_999 * 10_000 / 2, rel=0.01)
+
+
+def test_reductions():
+    a, b, c, d = normal(0, 1), uniform(1, 2), lognormal(0, 1), normal(1, 1)
+    total = a + b + c + d
+    assert isinstance(total.value, Sum) and len(total.value.values) == 4
+    assert total.digest is sum_of([a, b, c, d]).digest
+    assert str(total) == "normal(0, 1) + uniform(1, 2) + lognormal(0, 1) + normal(1, 1)"
+    assert str((a + b) * c * (a - d)) == (
+        "(normal(0, 1) + uniform(1, 2)) * lognormal(0, 1) * (normal(0, 1) - normal(1, 1))"
+    )
+    assert (
+        str(a - (b + c + d)) == "normal(0, 1) - (uniform(1, 2) + lognormal(0, 1) + normal(1, 1))"
+    )
+    # Extending a reduction twice doesn't change either extension
+    prefix = a + b + c
+    left, right = prefix + d, prefix * 2 + a
+    other = prefix + a
+    assert str(left) == "normal(0, 1) + uniform(1, 2) + lognormal(0, 1) + normal(1, 1)"
+    assert str(other) == "normal(0, 1) + uniform(1, 2) + lognormal(0, 1) + normal(0, 1)"
+    assert len(prefix.value.values) == 3
+    assert sum_of([]).value == 0 and product_of([a]) is a
+    with Context(cache={}, sample_count=1000):
+        expected = ~a + ~b + ~c + ~d
+        assert np.allclose(~total, expected)
+        assert np.allclose(~compile(total), expected)
+        assert np.allclose(~product_of([a, 2, b, c]), ~a * 2 * ~b * ~c)
+        assert np.allclose(~(left - other), ~d - ~a)
+        assert np.allclose(~right, (~a + ~b + ~c) * 2 + ~a)
+        assert np.allclose(~sum_of([a, b, a]), 2 * ~a + ~b)
+
+
+def test_reductions_accumulate_into_one_buffer():
+    terms = [normal(i, 1) for i in range(1000)]
+    plan = compile(sum_of(terms))
+    # Each term is added to the total as soon as it's drawn, rather than all being drawn first
+    assert len(plan.instructions) == 1999 and plan.width == 3
+    with Context(cache={}, sample_count=10):
+        samples = ~plan
+        assert samples.mean() == pytest.approx(999 * 1000 / 2, rel=0.01)
+        # The cached samples of the terms are read, but not written to
+        assert not any(np.shares_memory(samples, ~term) for term in terms)
+        assert abs((~terms[0]).mean()) < 2
+
+
+def test_reductions_of_mixed_types_accumulate_from_left_to_right():
+    a, b = normal(0, 1), normal(5, 1)
+    model = (a > 0) + (a > -1) + b * 1
+    results = []
+    for cache_rule in ("never", "constant", "always"):
+        for resolve in (lambda: ~model, lambda: ~compile(model)):
+            with Context(cache={}, cache_rule=cache_rule, seed=0):
+                results.append(resolve())
+    assert all(np.array_equal(result, results[0]) for result in results)
+    with Context(cache={}, seed=0):
+        # Booleans are summed as numbers rather than combined with `or`
+        assert np.array_equal(results[0], (~a > 0) + (~a > -1).astype(float) + ~b)